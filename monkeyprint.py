@@ -159,15 +159,16 @@ def runNoGui(filename=None, debug=False):
 	modelCollection.updateSliceStack()
 	print ("Starting slicer.")
 
-	# Wait for all slicer threads to finish.
-	while(modelCollection.slicerRunning()):
+	# Wait for the first layers to be sliced. The print process
+	# waits for the remaining layers if it catches up with the slicer.
+	while(not modelCollection.slicesReady(1, int(programSettings['Print start layers'].value)+1)):
 		modelCollection.checkSlicerThreads()
 		time.sleep(.2)
 		sys.stdout.write('.')
 		sys.stdout.flush()
 	
-	# Start print process when slicers are done.
-	print "\nSlicer done. Starting print process."
+	# Start print process when the first layers are done.
+	print "\nFirst layers sliced. Starting print process."
 	
 	# Create the projector window.
 	gui = monkeyprintGui.noGui(programSettings, modelCollection)	
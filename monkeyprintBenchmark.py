@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: latin-1 -*-
+
+#	Copyright (c) 2015 Paul Bomke
+#	Distributed under the GNU GPL v2.
+#
+#	This file is part of monkeyprint.
+#
+#	monkeyprint is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	monkeyprint is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You have received a copy of the GNU General Public License
+#    along with monkeyprint.  If not, see <http://www.gnu.org/licenses/>.
+
+# Slicer benchmark without GUI.
+# Loads the bundled project and a set of generated meshes, slices them
+# at several resolutions with and without hollowing and writes the
+# timings as JSON so that runs can be compared.
+
+import sys, getopt
+import os
+import time
+import json
+import shutil
+import tempfile
+import resource
+import numpy
+import vtk
+import monkeyprintSettings
+import monkeyprintModelHandling
+import monkeyprintMeshHandling as meshHandling
+
+
+# Pixels per mm and layer height in mm to run each fixture with.
+resolutions = [(10.0, 0.1), (10.0, 0.05), (20.0, 0.1)]
+
+# Project fixtures that come with monkeyprint.
+projectFixtures = ['./models/twoMonkeys.mkp']
+
+
+
+
+################################################################################
+# Synthetic fixtures. ##########################################################
+################################################################################
+# Get points and triangles of an axis aligned box.
+# Inverted boxes have their triangles facing inwards.
+def box(minimum, maximum, inverted=False):
+	points = numpy.array([[x, y, z] for z in (minimum[2], maximum[2]) for y in (minimum[1], maximum[1]) for x in (minimum[0], maximum[0])], numpy.float64)
+	triangles = numpy.array([	[0,2,1], [1,2,3],	# Bottom.
+								[4,5,6], [5,7,6],	# Top.
+								[0,1,4], [1,5,4],	# Front.
+								[2,6,3], [3,6,7],	# Back.
+								[0,4,2], [2,4,6],	# Left.
+								[1,3,5], [3,7,5]	], numpy.int64)	# Right.
+	if inverted:
+		triangles = triangles[:,::-1]
+	return points, triangles
+
+# Sphere with given radius and resolution.
+def sphere(radius, resolution):
+	source = vtk.vtkSphereSource()
+	source.SetRadius(radius)
+	source.SetThetaResolution(resolution)
+	source.SetPhiResolution(resolution)
+	source.Update()
+	return meshHandling.polydataToTriangles(source.GetOutput())
+
+# Grid of thin walled square tubes. Each tube is an outer box
+# with an inverted inner box.
+def lattice(cells, cellSize, wallThickness, height):
+	meshes = []
+	for i in range(cells):
+		for j in range(cells):
+			x = i * cellSize
+			y = j * cellSize
+			size = cellSize * 0.8
+			meshes.append(box((x, y, 0), (x+size, y+size, height)))
+			meshes.append(box((x+wallThickness, y+wallThickness, wallThickness), (x+size-wallThickness, y+size-wallThickness, height-wallThickness), inverted=True))
+	return meshHandling.joinMeshes(meshes)
+
+# High polygon sphere with a rough surface like a 3d scan.
+def scan(radius, resolution, roughness):
+	points, triangles = sphere(radius, resolution)
+	random = numpy.random.RandomState(0)
+	points = points * (1 + roughness * random.uniform(-1, 1, (len(points), 1)))
+	return points, triangles
+
+# Write a mesh to an stl file.
+def writeStl(filename, points, triangles):
+	writer = vtk.vtkSTLWriter()
+	writer.SetInput(meshHandling.trianglesToPolydata(points, triangles))
+	writer.SetFileName(filename)
+	writer.SetFileTypeToBinary()
+	writer.Write()
+
+# Create the synthetic fixtures in the given directory.
+# Returns a list of fixture names and stl file names.
+def createFixtures(path):
+	fixtures = [	('sphere', sphere(15.0, 64)),
+				('lattice', lattice(6, 5.0, 0.4, 20.0)),
+				('scan', scan(15.0, 600, 0.01))	]
+	filenames = []
+	for name, (points, triangles) in fixtures:
+		filename = os.path.join(path, name + '.stl')
+		writeStl(filename, points, triangles)
+		filenames.append((name, filename))
+	return filenames
+
+
+
+
+################################################################################
+# Benchmark. ###################################################################
+################################################################################
+# Get the peak resident set size of this process and its
+# slicer processes in kB.
+def getPeakRss():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+# Get latency statistics in ms from a list of times in seconds.
+def getLatencyStats(times):
+	if len(times) == 0:
+		return None
+	times = numpy.array(times) * 1000.
+	return {	'mean': float(numpy.mean(times)),
+			'p50': float(numpy.percentile(times, 50)),
+			'p90': float(numpy.percentile(times, 90)),
+			'p99': float(numpy.percentile(times, 99)),
+			'max': float(numpy.max(times))	}
+
+# Get the model containers of a collection without the default model.
+def getModels(modelCollection):
+	return [modelCollection[model] for model in modelCollection if model != 'default']
+
+
+# Run one benchmark case on the models that are loaded in the collection.
+def runCase(modelCollection, programSettings, fixture, pxPerMm, layerHeight, hollow, sampleLayers):
+	programSettings['pxPerMm'].value = pxPerMm
+	programSettings['Layer height'].value = layerHeight
+	result = {	'fixture': fixture,
+			'pxPerMm': pxPerMm,
+			'layerHeight': layerHeight,
+			'hollow': hollow	}
+
+	# Time support generation. Force a rebuild as the
+	# supports don't depend on the settings of the case.
+	for model in getModels(modelCollection):
+		model.settings['Print hollow'].value = hollow
+		model.settings['Fill'].value = hollow
+	interval = time.time()
+	for model in getModels(modelCollection):
+		model.updateSupports(force=True)
+	result['supportTime'] = time.time() - interval
+
+	# Time single layers in a pipeline of our own.
+	# Layers are sampled evenly over the model height.
+	latencies = []
+	timer = monkeyprintModelHandling.sliceTimer()
+	for model in getModels(modelCollection):
+		pipeline = monkeyprintModelHandling.slicePipeline(model.settings, programSettings)
+		pipeline.setInput([model.model.stlPositionFilter.GetOutput(), model.model.supports.GetOutput(), model.model.bottomPlate.GetOutput(), model.model.triangleIndex, model.model.getSupportGeometry()])
+		for sliceNumber in numpy.unique(numpy.linspace(0, pipeline.numberOfSlices-1, sampleLayers).astype(int)):
+			interval = time.time()
+			pipeline.sliceLayer(sliceNumber)
+			latencies.append(time.time() - interval)
+		timer.merge(pipeline.timer.pop())
+	result['layerLatency'] = getLatencyStats(latencies)
+	result['stages'] = timer.getSummary()
+
+	# Time the whole stack in the background slicers.
+	interval = time.time()
+	for model in getModels(modelCollection):
+		model.setChanged()
+	modelCollection.updateSliceStack()
+	while modelCollection.slicerRunning():
+		modelCollection.checkSlicerThreads()
+		time.sleep(.01)
+	result['sliceTime'] = time.time() - interval
+	result['layers'] = sum([len(model.model.sliceStack) for model in getModels(modelCollection)])
+	if result['sliceTime'] > 0:
+		result['layersPerSecond'] = result['layers'] / result['sliceTime']
+	result['peakRssKb'] = getPeakRss()
+	return result
+
+
+# Run all benchmark cases. Returns the results as a dictionary.
+def runBenchmark(programSettings, quick=False, sampleLayers=50):
+	# Don't let the disk cache or lazy slicing hide the slicing time.
+	programSettings['Slice cache size'].value = 0
+	programSettings['Lazy slicing'].value = False
+
+	modelCollection = monkeyprintModelHandling.modelCollection(programSettings)
+	fixturePath = tempfile.mkdtemp(prefix='monkeyprintBenchmark')
+	results = []
+	try:
+		# Get the fixtures. Each fixture is a list of model files
+		# or a project file.
+		fixtures = [(os.path.basename(filename), filename) for filename in projectFixtures if os.path.isfile(filename)]
+		fixtures += createFixtures(fixturePath)
+		if quick:
+			fixtures = fixtures[:1]
+		for fixture, filename in fixtures:
+			print "Loading " + fixture + "."
+			interval = time.time()
+			if filename.endswith('.mkp'):
+				modelCollection.loadProject(filename)
+			else:
+				modelCollection.removeAll()
+				modelCollection.add(fixture, filename)
+			loadTime = time.time() - interval
+			triangles = sum([model.model.stlPositionFilter.GetOutput().GetNumberOfPolys() for model in getModels(modelCollection)])
+			for pxPerMm, layerHeight in resolutions[:1] if quick else resolutions:
+				for hollow in (False, True):
+					print "Slicing " + fixture + " at " + str(pxPerMm) + " px/mm, " + str(layerHeight) + " mm layers, hollow " + str(hollow) + "."
+					result = runCase(modelCollection, programSettings, fixture, pxPerMm, layerHeight, hollow, sampleLayers)
+					result['loadTime'] = loadTime
+					result['triangles'] = triangles
+					results.append(result)
+	finally:
+		modelCollection.removeAll()
+		shutil.rmtree(fixturePath, ignore_errors=True)
+
+	return {	'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+			'settings': dict([(key, programSettings[key].value) for key in ['Slicing engine', 'Slicer processes', 'Slice storage', 'Hollowing method', 'Combined stencil', 'Analytic supports']]),
+			'results': results	}
+
+
+
+
+def main(argv):
+	# Check command line arguments.
+	# -h: print usage instructions.
+	# -o: write results to file instead of stdout.
+	# -s: use the settings from the settings file instead of the defaults.
+	# -q: quick run with one fixture and one resolution.
+	# -n: number of layers per model to time one by one.
+	try:
+		opts, args = getopt.getopt(argv, "hsqo:n:", ["output=", "layers="])
+	except getopt.GetoptError:
+		usage()
+		sys.exit(2)
+
+	outputFile = None
+	readSettings = False
+	quick = False
+	sampleLayers = 50
+	for opt, arg in opts:
+		if opt == "-h":
+			usage()
+			sys.exit(2)
+		elif opt in ("-o", "--output"):
+			outputFile = arg
+		elif opt == "-s":
+			readSettings = True
+		elif opt == "-q":
+			quick = True
+		elif opt in ("-n", "--layers"):
+			sampleLayers = int(arg)
+
+	# Create program settings.
+	programSettings = monkeyprintSettings.programSettings()
+	if readSettings:
+		programSettings.readFile()
+	programSettings['Debug'].value = False
+
+	results = runBenchmark(programSettings, quick, sampleLayers)
+
+	# Write results.
+	if outputFile != None:
+		with open(outputFile, 'w') as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+		print "Results written to " + outputFile + "."
+	else:
+		print json.dumps(results, indent=2, sort_keys=True)
+
+
+def usage():
+	print "\nUsage: monkeyprintBenchmark.py <options>\n"
+	print "-h:                              Show this help text."
+	print "-o or --output <filename.json>:  Write results to file."
+	print "-s:                              Use the settings file instead of the"
+	print "                                 default settings."
+	print "-q:                              Quick run with one fixture and resolution."
+	print "-n or --layers <number>:         Number of layers per model to time"
+	print "                                 one by one. Default is 50."
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -78,8 +78,8 @@ class noGui(monkeyprintGuiHelper.projectorDisplay):
 		gtk.gdk.threads_init()
 		
 		# Add thread listener functions to run every n ms.****
-		# Check if the slicer threads have finished.
-#		slicerListenerId = gobject.timeout_add(100, self.modelCollection.checkSlicerThreads)
+		# Check the slicer threads. Printing starts before slicing is done.
+		slicerListenerId = gobject.timeout_add(100, self.modelCollection.checkSlicerThreads)
 		# Update the progress bar, projector image and 3d view. during prints.
 		pollPrintQueuesId = gobject.timeout_add(50, self.pollPrintQueues)
 		
@@ -998,6 +998,8 @@ class gui(gtk.Window):
 		self.boxSupportPattern.pack_start(self.entrySupportSpacingY, expand=False, fill=False)
 		self.entrySupportMaxHeight = monkeyprintGuiHelper.entry('Maximum height', modelCollection=self.modelCollection, customFunctions=[self.updateCurrentModel, self.renderView.render, self.updateAllEntries])
 		self.boxSupportPattern.pack_start(self.entrySupportMaxHeight, expand=False, fill=False)
+		self.checkboxSupportRegions = monkeyprintGuiHelper.toggleButton(string="Support regions", settings=None, modelCollection=self.modelCollection, customFunctions=[self.updateCurrentModel, self.renderView.render, self.updateAllEntries])
+		self.boxSupportPattern.pack_start(self.checkboxSupportRegions, expand=False, fill=False)
 		
 		# Create support geometry frame.
 		self.frameSupportGeometry = gtk.Frame(label="Support geometry")
@@ -1476,6 +1478,7 @@ class gui(gtk.Window):
 			self.entrySupportSpacingX.set_sensitive(False)
 			self.entrySupportSpacingY.set_sensitive(False)
 			self.entrySupportMaxHeight.set_sensitive(False)
+			self.checkboxSupportRegions.set_sensitive(False)
 			self.entrySupportBaseDiameter.set_sensitive(False)
 			self.entrySupportTipDiameter.set_sensitive(False)
 			self.entrySupportTipHeight.set_sensitive(False)
@@ -1497,6 +1500,7 @@ class gui(gtk.Window):
 			self.entrySupportSpacingX.set_sensitive(True)
 			self.entrySupportSpacingY.set_sensitive(True)
 			self.entrySupportMaxHeight.set_sensitive(True)
+			self.checkboxSupportRegions.set_sensitive(True)
 			self.entrySupportBaseDiameter.set_sensitive(True)
 			self.entrySupportTipDiameter.set_sensitive(True)
 			self.entrySupportTipHeight.set_sensitive(True)
@@ -1517,6 +1521,7 @@ class gui(gtk.Window):
 			self.entrySupportSpacingX.update()
 			self.entrySupportSpacingY.update()
 			self.entrySupportMaxHeight.update()
+			self.checkboxSupportRegions.update()
 			self.entrySupportBaseDiameter.update()
 			self.entrySupportTipDiameter.update()
 			self.entrySupportTipHeight.update()
@@ -2302,7 +2307,64 @@ class dialogSettings(gtk.Window):
 		self.entryBuildSizeZ= monkeyprintGuiHelper.entry('Build size Z', self.settings, width=15)
 		self.boxBuildVolume.pack_start(self.entryBuildSizeZ, expand=False, fill=False)
 		self.entryBuildSizeZ.show()
-		
+
+		# Frame for slicer settings.
+		self.frameSlicer = gtk.Frame('Slicer')
+		boxMainSettings.pack_start(self.frameSlicer, expand=False, fill=False, padding=5)
+		self.frameSlicer.show()
+		self.boxSlicer = gtk.VBox()
+		self.frameSlicer.add(self.boxSlicer)
+		self.boxSlicer.show()
+		# Add entries.
+		self.entrySlicerProcesses = monkeyprintGuiHelper.entry('Slicer processes', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySlicerProcesses, expand=False, fill=False)
+		self.entrySlicerProcesses.show()
+		self.entrySlicingEngine = monkeyprintGuiHelper.entry('Slicing engine', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySlicingEngine, expand=False, fill=False)
+		self.entrySlicingEngine.show()
+		self.checkbuttonLazySlicing = monkeyprintGuiHelper.toggleButton('Lazy slicing', settings=self.settings)
+		self.boxSlicer.pack_start(self.checkbuttonLazySlicing, expand=False, fill=False)
+		self.checkbuttonLazySlicing.show()
+		self.entryPrefetchLayers = monkeyprintGuiHelper.entry('Prefetch layers', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entryPrefetchLayers, expand=False, fill=False)
+		self.entryPrefetchLayers.show()
+		self.entryPriorityLayers = monkeyprintGuiHelper.entry('Priority layers', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entryPriorityLayers, expand=False, fill=False)
+		self.entryPriorityLayers.show()
+		self.entrySliceCachePath = monkeyprintGuiHelper.entry('Slice cache path', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceCachePath, expand=False, fill=False)
+		self.entrySliceCachePath.show()
+		self.entrySliceCacheSize = monkeyprintGuiHelper.entry('Slice cache size', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceCacheSize, expand=False, fill=False)
+		self.entrySliceCacheSize.show()
+		self.entrySliceStorage = monkeyprintGuiHelper.entry('Slice storage', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceStorage, expand=False, fill=False)
+		self.entrySliceStorage.show()
+		self.checkbuttonMemoryMappedSlices = monkeyprintGuiHelper.toggleButton('Memory mapped slices', settings=self.settings)
+		self.boxSlicer.pack_start(self.checkbuttonMemoryMappedSlices, expand=False, fill=False)
+		self.checkbuttonMemoryMappedSlices.show()
+		self.entrySliceScratchPath = monkeyprintGuiHelper.entry('Slice scratch path', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceScratchPath, expand=False, fill=False)
+		self.entrySliceScratchPath.show()
+		self.checkbuttonCombinedStencil = monkeyprintGuiHelper.toggleButton('Combined stencil', settings=self.settings)
+		self.boxSlicer.pack_start(self.checkbuttonCombinedStencil, expand=False, fill=False)
+		self.checkbuttonCombinedStencil.show()
+		self.checkbuttonAnalyticSupports = monkeyprintGuiHelper.toggleButton('Analytic supports', settings=self.settings)
+		self.boxSlicer.pack_start(self.checkbuttonAnalyticSupports, expand=False, fill=False)
+		self.checkbuttonAnalyticSupports.show()
+		self.entrySliceTileSize = monkeyprintGuiHelper.entry('Slice tile size', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceTileSize, expand=False, fill=False)
+		self.entrySliceTileSize.show()
+		self.entryHollowingMethod = monkeyprintGuiHelper.entry('Hollowing method', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entryHollowingMethod, expand=False, fill=False)
+		self.entryHollowingMethod.show()
+		self.entryPrintStartLayers = monkeyprintGuiHelper.entry('Print start layers', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entryPrintStartLayers, expand=False, fill=False)
+		self.entryPrintStartLayers.show()
+		self.entrySliceTimingFile = monkeyprintGuiHelper.entry('Slice timing file', self.settings, width=15)
+		self.boxSlicer.pack_start(self.entrySliceTimingFile, expand=False, fill=False)
+		self.entrySliceTimingFile.show()
+
 		# Frame for build volume settings.
 		self.frameDebug = gtk.Frame('Debug')
 		boxMainSettings.pack_start(self.frameDebug, expand=False, fill=False, padding=5)
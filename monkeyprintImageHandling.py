@@ -181,6 +181,93 @@ def imgDilate(img, radius=1):
 	return dilated
 
 
+# Get the cavity of a hollow model from a stack of slices.
+# Returns a boolean volume that is True for all voxels that are further
+# inside the model than the wall thickness. Spacing is the voxel size in
+# mm as (z, y, x). The distance transform only runs on the bounding box
+# of the model.
+def shellCavity(volume, wallThickness, spacing):
+	cavity = numpy.zeros(volume.shape, bool)
+	solid = volume > 0
+	box = []
+	for axis in range(3):
+		others = tuple([i for i in range(3) if i != axis])
+		indices = numpy.nonzero(solid.any(axis=others))[0]
+		if len(indices) == 0:
+			return cavity
+		# Leave one empty voxel around the model.
+		box.append(slice(max(0, indices[0]-1), indices[-1]+2))
+	box = tuple(box)
+	distance = ndimage.distance_transform_edt(solid[box], sampling=spacing)
+	cavity[box] = distance > wallThickness
+	return cavity
+
+
+# Fill patterns by image size, spacing and wall thickness.
+fillPatterns = {}
+
+# Create a rectangular grid pattern for filling large model areas.
+# Every Nth row and column (and its neighbour or so) is black.
+# Spacing and wall thickness are given in pixels. Returns the pattern
+# tiled twice in both directions, so that a shifted pattern can
+# be taken from it as a view. Patterns are cached.
+def createFillPattern(width, height, spacing, wallThickness):
+	key = (width, height, spacing, wallThickness)
+	# Other slicer threads may clear the cache at any time,
+	# so keep the pattern in a local.
+	imageFill = fillPatterns.get(key)
+	if imageFill is None:
+		# Keep only a few patterns.
+		if len(fillPatterns) > 4:
+			fillPatterns.clear()
+		# Lines are set one pixel left of and above the grid position.
+		x = numpy.arange(width)
+		columns = numpy.roll((x / float(spacing) - numpy.floor(x / float(spacing))) * spacing >= wallThickness, -1)
+		y = numpy.arange(height)
+		rows = numpy.roll((y / float(spacing) - numpy.floor(y / float(spacing))) * spacing >= wallThickness, -1)
+		imageFill = numpy.uint8(numpy.logical_and(rows[:,None], columns[None,:])) * numpy.uint8(255)
+		imageFill = numpy.tile(imageFill, (2,2))
+		fillPatterns[key] = imageFill
+	return imageFill
+
+
+# Fill discs given by centers and radii in mm into an image.
+# Origin is the position of the first pixel in mm, spacing the
+# pixel size in mm. Pixels with their center inside a disc turn white.
+# All discs are split into runs per row and filled at once.
+def fillDiscs(img, centers, radii, origin, spacing):
+	if len(radii) == 0:
+		return img
+	# Disc centers and radii in pixels.
+	centerX = (centers[:,0] - origin[0]) / spacing
+	centerY = (centers[:,1] - origin[1]) / spacing
+	radii = radii / spacing
+	# Rows covered by each disc.
+	firstRows = numpy.maximum(numpy.ceil(centerY - radii), 0).astype(numpy.int64)
+	lastRows = numpy.minimum(numpy.floor(centerY + radii), img.shape[0] - 1).astype(numpy.int64)
+	numberOfRows = numpy.maximum(lastRows - firstRows + 1, 0)
+	if numberOfRows.sum() == 0:
+		return img
+	# One run per disc and row.
+	discs = numpy.repeat(numpy.arange(len(radii)), numberOfRows)
+	rows = numpy.arange(len(discs)) - numpy.repeat(numpy.cumsum(numberOfRows) - numberOfRows, numberOfRows) + firstRows[discs]
+	halfWidths = numpy.sqrt(numpy.maximum(radii[discs]**2 - (rows - centerY[discs])**2, 0))
+	starts = numpy.clip(numpy.ceil(centerX[discs] - halfWidths), 0, img.shape[1]).astype(numpy.int64)
+	ends = numpy.clip(numpy.floor(centerX[discs] + halfWidths) + 1, 0, img.shape[1]).astype(numpy.int64)
+	inside = starts < ends
+	return compositeRuns(img, [(rows[inside], starts[inside], ends[inside])])
+
+# Fill an axis aligned rectangle given by its corners in mm into an image.
+def fillRectangle(img, minimum, maximum, origin, spacing):
+	firstColumn = max(int(math.ceil((minimum[0] - origin[0]) / spacing)), 0)
+	lastColumn = min(int(math.floor((maximum[0] - origin[0]) / spacing)) + 1, img.shape[1])
+	firstRow = max(int(math.ceil((minimum[1] - origin[1]) / spacing)), 0)
+	lastRow = min(int(math.floor((maximum[1] - origin[1]) / spacing)) + 1, img.shape[0])
+	if firstColumn < lastColumn and firstRow < lastRow:
+		img[firstRow:lastRow, firstColumn:lastColumn] = 255
+	return img
+
+
 # Convert single channel to 3 channel grayscale.
 def convertSingle2RGB(img):
 	# Expand in 3d dimension.
@@ -188,6 +275,114 @@ def convertSingle2RGB(img):
 	img = numpy.repeat(img, 3, axis=2)
 	return img
 
+
+# Black and white image packed to one bit per pixel.
+class packedImage:
+	def __init__(self, data, shape):
+		self.data = data
+		self.shape = tuple(shape)
+	
+	# Unpack to a single channel image with values 0 and 255.
+	def unpack(self):
+		img = numpy.unpackbits(self.data)[:self.shape[0]*self.shape[1]]
+		return img.reshape(self.shape) * numpy.uint8(255)
+
+# Pack a single channel black and white image. All pixels
+# that are not black will be white after unpacking.
+def packImage(img):
+	return packedImage(numpy.packbits(img > 0), img.shape)
+
+
+# Black and white image stored as white runs per row inside its
+# bounding box. Empty images don't store any runs.
+class runLengthImage:
+	def __init__(self, shape, offset=(0,0), rows=None, starts=None, ends=None):
+		self.shape = tuple(shape)
+		# Row and column of the bounding box corner.
+		self.offset = offset
+		# Row, first column and column after the last pixel
+		# of each run relative to the bounding box.
+		self.rows = rows
+		self.starts = starts
+		self.ends = ends
+	
+	# Check if there are any white pixels.
+	def isEmpty(self):
+		return self.rows is None
+	
+	# Get the runs in frame coordinates for an image position given as (x, y).
+	# Runs are clipped to the frame size given as (height, width).
+	def getRuns(self, position=(0,0), frameShape=None):
+		rows = self.rows.astype(numpy.int64) + self.offset[0] + int(position[1])
+		starts = self.starts.astype(numpy.int64) + self.offset[1] + int(position[0])
+		ends = self.ends.astype(numpy.int64) + self.offset[1] + int(position[0])
+		if frameShape != None:
+			inside = (rows >= 0) & (rows < frameShape[0])
+			rows = rows[inside]
+			starts = numpy.clip(starts[inside], 0, frameShape[1])
+			ends = numpy.clip(ends[inside], 0, frameShape[1])
+		return rows, starts, ends
+	
+	# Unpack to a single channel image with values 0 and 255.
+	def unpack(self):
+		img = numpy.zeros(self.shape, numpy.uint8)
+		if not self.isEmpty():
+			compositeRuns(img, [self.getRuns()])
+		return img
+
+# Run length encode a single channel black and white image. All pixels
+# that are not black will be white after unpacking.
+def runLengthEncode(img):
+	white = img > 0
+	# Find the bounding box.
+	rows = numpy.nonzero(white.any(axis=1))[0]
+	if len(rows) == 0:
+		return runLengthImage(img.shape)
+	columns = numpy.nonzero(white.any(axis=0))[0]
+	white = white[rows[0]:rows[-1]+1, columns[0]:columns[-1]+1]
+	# Find where runs start and end by padding each row with black
+	# and looking for changes from one pixel to the next.
+	padded = numpy.zeros((white.shape[0], white.shape[1]+2), numpy.int8)
+	padded[:,1:-1] = white
+	change = numpy.diff(padded, axis=1)
+	runRows, starts = numpy.nonzero(change == 1)
+	ends = numpy.nonzero(change == -1)[1]
+	# Use small integers if possible.
+	if max(img.shape) < 65535:
+		dtype = numpy.uint16
+	else:
+		dtype = numpy.int32
+	return runLengthImage(img.shape, (rows[0], columns[0]), runRows.astype(dtype), starts.astype(dtype), ends.astype(dtype))
+
+# Composite runs given as list of (rows, starts, ends) into an image.
+# Each run adds one at its start and subtracts one after its end.
+# The sum along the rows is larger than zero for all white pixels.
+def compositeRuns(img, runs):
+	change = numpy.zeros((img.shape[0], img.shape[1]+1), numpy.int32)
+	for rows, starts, ends in runs:
+		numpy.add.at(change, (rows, starts), 1)
+		numpy.subtract.at(change, (rows, ends), 1)
+	white = numpy.cumsum(change, axis=1)[:,:-1] > 0
+	img[white] = 255
+	return img
+
+# Unpack an image if it is packed or run length encoded.
+def unpackImage(img):
+	if isinstance(img, packedImage) or isinstance(img, runLengthImage):
+		return img.unpack()
+	return img
+
+# Convert an image to the given storage type.
+# Storage may be 'full', 'packed' or 'rle'.
+def encodeImage(img, storage):
+	if storage == 'packed' and not isinstance(img, packedImage):
+		return packImage(unpackImage(img))
+	elif storage == 'rle' and not isinstance(img, runLengthImage):
+		return runLengthEncode(unpackImage(img))
+	elif storage == 'full':
+		return unpackImage(img)
+	return img
+
 '''
 imageInsert = createImageGray(4,2,50)
 imageRing= createImageRing()
@@ -0,0 +1,713 @@
+# -*- coding: latin-1 -*-
+
+#	Copyright (c) 2015 Paul Bomke
+#	Distributed under the GNU GPL v2.
+#
+#	This file is part of monkeyprint.
+#
+#	monkeyprint is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	monkeyprint is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You have received a copy of the GNU General Public License
+#    along with monkeyprint.  If not, see <http://www.gnu.org/licenses/>.
+
+# Functions that work on triangle meshes as numpy arrays.
+# A mesh is a tuple of a point array (n x 3, float) and a
+# triangle array (m x 3, int) holding point indices.
+
+import copy
+import vtk
+from vtk.util import numpy_support	# Functions to convert between numpy and vtk
+import numpy
+import cv2
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+# Convert polydata to point and triangle arrays.
+# Polygons are triangulated and coincident points are merged
+# so that neighbouring triangles share their point indices.
+def polydataToTriangles(polydata):
+	# Triangulate.
+	triangleFilter = vtk.vtkTriangleFilter()
+	triangleFilter.SetInput(polydata)
+	# Merge coincident points.
+	cleanFilter = vtk.vtkCleanPolyData()
+	cleanFilter.SetInput(triangleFilter.GetOutput())
+	cleanFilter.Update()
+	output = cleanFilter.GetOutput()
+	# Return empty mesh if there are no triangles.
+	if output.GetNumberOfPolys() == 0:
+		return (numpy.zeros((0,3), numpy.float64), numpy.zeros((0,3), numpy.int64))
+	# Get points.
+	points = numpy_support.vtk_to_numpy(output.GetPoints().GetData())
+	points = numpy.array(points, dtype=numpy.float64)
+	# Get triangles. Cell array is [3, id, id, id, 3, id, ...].
+	triangles = numpy_support.vtk_to_numpy(output.GetPolys().GetData())
+	triangles = numpy.array(triangles.reshape(-1,4)[:,1:], dtype=numpy.int64)
+	return (points, triangles)
+
+
+# Create polydata from point and triangle arrays.
+# Only the points used by the triangles are copied.
+def trianglesToPolydata(points, triangles):
+	usedPoints, cellPoints = numpy.unique(triangles, return_inverse=True)
+	# Set points.
+	vtkPoints = vtk.vtkPoints()
+	vtkPoints.SetData(numpy_support.numpy_to_vtk(numpy.ascontiguousarray(points[usedPoints]), deep=1))
+	# Set triangles. Cell array is [3, id, id, id, 3, id, ...].
+	cells = numpy.empty((len(triangles), 4), dtype=numpy_support.ID_TYPE_CODE)
+	cells[:,0] = 3
+	cells[:,1:] = cellPoints.reshape(-1,3)
+	vtkCells = vtk.vtkCellArray()
+	vtkCells.SetCells(len(triangles), numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(), deep=1))
+	polydata = vtk.vtkPolyData()
+	polydata.SetPoints(vtkPoints)
+	polydata.SetPolys(vtkCells)
+	return polydata
+
+
+# Create a cone with its base of radius 1 at z = 0
+# and its tip at z = 1. The base is closed.
+def coneMesh(resolution):
+	angles = numpy.arange(resolution) * 2 * numpy.pi / resolution
+	points = numpy.zeros((resolution + 2, 3))
+	points[:resolution,0] = numpy.cos(angles)
+	points[:resolution,1] = numpy.sin(angles)
+	# Tip and base center.
+	points[resolution] = (0, 0, 1)
+	first = numpy.arange(resolution)
+	second = (first + 1) % resolution
+	tip = numpy.repeat(resolution, resolution)
+	center = numpy.repeat(resolution + 1, resolution)
+	triangles = numpy.vstack((	numpy.column_stack((first, second, tip)),
+								numpy.column_stack((second, first, center))	))
+	return points, triangles
+
+# Create a cylinder of radius 1 from z = 0 to z = 1. Both ends are closed.
+def cylinderMesh(resolution):
+	angles = numpy.arange(resolution) * 2 * numpy.pi / resolution
+	points = numpy.zeros((2 * resolution + 2, 3))
+	points[:2*resolution,0] = numpy.tile(numpy.cos(angles), 2)
+	points[:2*resolution,1] = numpy.tile(numpy.sin(angles), 2)
+	points[resolution:2*resolution,2] = 1
+	# Bottom and top center.
+	points[2*resolution+1] = (0, 0, 1)
+	first = numpy.arange(resolution)
+	second = (first + 1) % resolution
+	bottom = numpy.repeat(2 * resolution, resolution)
+	top = numpy.repeat(2 * resolution + 1, resolution)
+	triangles = numpy.vstack((	numpy.column_stack((first, second, second + resolution)),
+								numpy.column_stack((first, second + resolution, first + resolution)),
+								numpy.column_stack((second, first, bottom)),
+								numpy.column_stack((first + resolution, second + resolution, top))	))
+	return points, triangles
+
+# Place copies of a mesh. Each copy is scaled and then moved by one
+# row of scales and translations (k x 3 each).
+def instanceMesh(points, triangles, scales, translations):
+	instancePoints = points[numpy.newaxis] * scales[:,numpy.newaxis] + translations[:,numpy.newaxis]
+	instanceTriangles = triangles[numpy.newaxis] + (numpy.arange(len(scales)) * len(points))[:,numpy.newaxis,numpy.newaxis]
+	return instancePoints.reshape(-1,3), instanceTriangles.reshape(-1,3)
+
+# Join several meshes into one.
+def joinMeshes(meshes):
+	points = []
+	triangles = []
+	offset = 0
+	for meshPoints, meshTriangles in meshes:
+		points.append(meshPoints)
+		triangles.append(meshTriangles + offset)
+		offset += len(meshPoints)
+	return numpy.vstack(points), numpy.vstack(triangles)
+
+
+################################################################################
+# Triangle index for sweeping slice planes. ####################################
+################################################################################
+# Holds the triangles of a mesh sorted by their lowest point so the
+# triangles cut by a slice plane can be found without testing the whole mesh.
+# While the plane sweeps upwards, an active set of cut triangles is kept
+# for every sweep: triangles are added once the plane passes their lowest
+# point and dropped once it passes their highest point.
+# Multiple sweeps are kept to allow for interleaved queries, e.g. the masks
+# above and below the current layer used for hollowing.
+class triangleIndex:
+	def __init__(self, points, triangles, maxSweeps=4):
+		self.points = points
+		self.triangles = triangles
+		self.maxSweeps = maxSweeps
+		# Get height range of all triangles.
+		zTriangles = points[triangles,2]
+		self.zMin = zTriangles.min(axis=1)
+		self.zMax = zTriangles.max(axis=1)
+		# Sort by lowest point.
+		self.order = numpy.argsort(self.zMin, kind='mergesort')
+		self.zMinSorted = self.zMin[self.order]
+		# Height of the tallest triangle limits the search range for lookups.
+		if len(triangles):
+			self.maxExtent = (self.zMax - self.zMin).max()
+		else:
+			self.maxExtent = 0
+		# Sweep states as lists of height, sort position and active set.
+		self.sweeps = []
+	
+	
+	# Get indices of triangles cut by the plane at height z.
+	# A triangle is cut if its lowest point is below and its highest point
+	# is on or above the plane, like in intersectTriangles.
+	def getActive(self, z):
+		# Find the closest sweep below the plane and move it upwards.
+		sweep = None
+		for candidate in self.sweeps:
+			if candidate[0] <= z and (sweep == None or candidate[0] > sweep[0]):
+				sweep = candidate
+		if sweep == None:
+			# Start a new sweep. Only triangles starting within one
+			# triangle height below the plane can be cut.
+			start = numpy.searchsorted(self.zMinSorted, z - self.maxExtent, side='left')
+			sweep = [z, start, numpy.zeros(0, numpy.int64)]
+			# Drop the lowest sweep if there are too many.
+			if len(self.sweeps) >= self.maxSweeps:
+				self.sweeps.remove(min(self.sweeps, key=lambda item: item[0]))
+			self.sweeps.append(sweep)
+		# Add triangles the plane has passed the lowest point of.
+		end = numpy.searchsorted(self.zMinSorted, z, side='left')
+		active = numpy.concatenate((sweep[2], self.order[sweep[1]:end]))
+		# Drop triangles that are below the plane.
+		active = active[self.zMax[active] >= z]
+		sweep[0] = z
+		sweep[1] = end
+		sweep[2] = active
+		return active
+	
+	
+	# Get the triangles cut by the plane at height z.
+	def getTriangles(self, z):
+		return self.triangles[self.getActive(z)]
+	
+	
+	# Get an index that shares the arrays but has its own sweep
+	# states, so that it can be used by another thread.
+	def copy(self):
+		index = copy.copy(self)
+		index.sweeps = []
+		return index
+	
+	
+	# Don't pickle the sweep states, e.g. when passing the
+	# index to slicer processes.
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['sweeps'] = []
+		return state
+
+
+# Intersect triangles with the plane at height z.
+# Returns the segment start and end points (k x 2 each) and the keys of the
+# mesh edges the segment start and end points lie on.
+# Segments are oriented by the triangle winding, so for a consistently
+# wound mesh the end key of a segment is the start key of the next one.
+def intersectTriangles(points, triangles, z):
+	# Points on the plane count as above to avoid degenerate cases.
+	pointAbove = points[:,2] >= z
+	triangleAbove = pointAbove[triangles]
+	numberAbove = triangleAbove.sum(axis=1)
+	# Only triangles with points on both sides are cut.
+	crossing = (numberAbove == 1) | (numberAbove == 2)
+	triangles = triangles[crossing]
+	triangleAbove = triangleAbove[crossing]
+	numberAbove = numberAbove[crossing]
+	if len(triangles) == 0:
+		empty = numpy.zeros((0,2), numpy.float64)
+		return (empty, empty, numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.int64))
+	rows = numpy.arange(len(triangles))
+	# Find the single point that is alone on its side of the plane.
+	# Edge i runs from point i to point i+1. The two edges adjacent to the
+	# lone point are cut by the plane.
+	lone = numpy.where(numberAbove == 1, numpy.argmax(triangleAbove, axis=1), numpy.argmin(triangleAbove, axis=1))
+	# Edge entering the lone point and edge leaving it.
+	edgeIn = (lone + 2) % 3
+	edgeOut = lone
+	# Intersection points on both edges.
+	pointsIn, keysIn = _intersectEdges(points, triangles, rows, edgeIn, z)
+	pointsOut, keysOut = _intersectEdges(points, triangles, rows, edgeOut, z)
+	# Orient segments. If the lone point is above the plane, the winding
+	# runs from the outgoing edge to the incoming edge and vice versa.
+	loneAbove = numberAbove == 1
+	start = numpy.where(loneAbove[:,None], pointsOut, pointsIn)
+	end = numpy.where(loneAbove[:,None], pointsIn, pointsOut)
+	startKeys = numpy.where(loneAbove, keysOut, keysIn)
+	endKeys = numpy.where(loneAbove, keysIn, keysOut)
+	return (start, end, startKeys, endKeys)
+
+
+# Intersect one edge per triangle with the plane at height z.
+# Returns the intersection points and a key that identifies the edge.
+def _intersectEdges(points, triangles, rows, edges, z):
+	a = triangles[rows, edges]
+	b = triangles[rows, (edges + 1) % 3]
+	# Sort point indices so both triangles of an edge compute the same point.
+	low = numpy.minimum(a, b)
+	high = numpy.maximum(a, b)
+	pointsLow = points[low]
+	pointsHigh = points[high]
+	t = (z - pointsLow[:,2]) / (pointsHigh[:,2] - pointsLow[:,2])
+	intersection = pointsLow[:,:2] + t[:,None] * (pointsHigh[:,:2] - pointsLow[:,:2])
+	keys = low * len(points) + high
+	return (intersection, keys)
+
+
+# Join oriented segments into contours.
+# Returns a list of point arrays (k x 2), one per contour.
+# Segments are joined where the end key of one segment matches the start
+# key of another. Open contours, e.g. from broken meshes, are returned as
+# chains and will be closed by the fill function.
+def joinSegments(start, startKeys, endKeys):
+	n = len(start)
+	if n == 0:
+		return []
+	indices = numpy.arange(n)
+	# Match end keys to start keys. Pair up equal keys in sorted order
+	# which gives a valid successor for every matched segment.
+	startOrder = numpy.argsort(startKeys, kind='mergesort')
+	endOrder = numpy.argsort(endKeys, kind='mergesort')
+	startSorted = startKeys[startOrder]
+	endSorted = endKeys[endOrder]
+	successor = indices.copy()
+	if numpy.array_equal(startSorted, endSorted):
+		successor[endOrder] = startOrder
+	else:
+		# Keys don't pair up completely. Match what we can.
+		position = numpy.searchsorted(startSorted, endKeys)
+		position = numpy.minimum(position, n-1)
+		matched = numpy.nonzero(startSorted[position] == endKeys)[0]
+		# Only use every start point once.
+		unused, first = numpy.unique(position[matched], return_index=True)
+		matched = matched[first]
+		successor[matched] = startOrder[position[matched]]
+	# Find cycles by pointer jumping. After enough jumps, segments in
+	# chains have arrived at their chain end which points to itself.
+	steps = int(numpy.ceil(numpy.log2(n))) + 1
+	jump = successor.copy()
+	lowest = indices.copy()
+	for i in range(steps):
+		lowest = numpy.minimum(lowest, lowest[jump])
+		jump = jump[jump]
+	inCycle = successor[jump] != jump
+	# Break cycles before their lowest segment index.
+	breakCycle = inCycle & (successor == lowest)
+	successor[breakCycle] = indices[breakCycle]
+	# Rank segments by their distance to the end of their chain.
+	distance = (successor != indices).astype(numpy.int64)
+	jump = successor.copy()
+	for i in range(steps):
+		distance = distance + distance[jump]
+		jump = jump[jump]
+	# Sort by chain and by descending distance to chain end.
+	order = numpy.lexsort((-distance, jump))
+	# Split into contours.
+	chains = jump[order]
+	splits = numpy.nonzero(chains[1:] != chains[:-1])[0] + 1
+	return numpy.split(start[order], splits)
+
+
+# Slice a mesh at height z. Returns a list of contours.
+def sliceTriangles(points, triangles, z):
+	start, end, startKeys, endKeys = intersectTriangles(points, triangles, z)
+	return joinSegments(start, startKeys, endKeys)
+
+
+# Slice an indexed mesh at height z. Only the triangles
+# cut by the plane are intersected. Returns a list of contours.
+def sliceIndex(index, z):
+	return sliceTriangles(index.points, index.getTriangles(z), z)
+
+
+# Fill contours into a new single channel image using even-odd filling.
+# If an image is given, the contours are filled into it instead.
+# Origin and spacing are given in mm. Pixel centers lie at
+# origin + index * spacing like in a vtkImageData.
+def fillContours(contours, origin, spacing, width, height, image=None):
+	if image is None:
+		image = numpy.zeros((height, width), numpy.uint8)
+	if len(contours) == 0:
+		return image
+	# Use fractional pixel coordinates for accuracy.
+	shift = 8
+	scale = (1 << shift) / float(spacing)
+	polygons = []
+	for contour in contours:
+		polygon = numpy.round((contour - numpy.array(origin[:2])) * scale)
+		polygons.append(polygon.astype(numpy.int32))
+	cv2.fillPoly(image, polygons, 255, 8, shift)
+	return image
+
+
+################################################################################
+# Column voxelizer. ############################################################
+################################################################################
+# Slices a mesh column by column instead of layer by layer. A vertical ray
+# through each pixel center is intersected with all triangles. Sorting the
+# crossings along each ray gives the intervals that are inside the mesh
+# (even-odd rule). A layer is then just a test of all intervals against the
+# slice height, so the mesh is only touched once for the whole stack.
+class columnIntervals:
+	def __init__(self, points, triangles, origin, spacing, width, height):
+		self.width = width
+		self.height = height
+		pixels, z = rayCrossings(points, triangles, origin, spacing, width, height)
+		# Sort crossings by pixel and height.
+		order = numpy.lexsort((z, pixels))
+		pixels = pixels[order]
+		z = z[order]
+		# Pair up the crossings of each pixel to entry and exit.
+		# Drop the last crossing of rays with an odd number
+		# of crossings, e.g. from broken meshes.
+		groupStarts = numpy.flatnonzero(numpy.r_[True, pixels[1:] != pixels[:-1]])
+		groupSizes = numpy.diff(numpy.append(groupStarts, len(pixels)))
+		rank = numpy.arange(len(pixels)) - numpy.repeat(groupStarts, groupSizes)
+		entries = numpy.flatnonzero((rank % 2 == 0) & (rank + 1 < numpy.repeat(groupSizes, groupSizes)))
+		# Sort intervals by entry height so that only those starting
+		# below a slice have to be tested.
+		order = numpy.argsort(z[entries], kind='mergesort')
+		entries = entries[order]
+		self.pixels = pixels[entries]
+		self.entries = z[entries]
+		self.exits = z[entries + 1]
+	
+	
+	# Fill all pixels whose ray is inside the mesh at height z into
+	# a new single channel image. If an image is given, the pixels
+	# are filled into it instead.
+	def getSlice(self, z, image=None):
+		if image is None:
+			image = numpy.zeros((self.height, self.width), numpy.uint8)
+		end = numpy.searchsorted(self.entries, z, side='right')
+		inside = self.exits[:end] > z
+		image.reshape(-1)[self.pixels[:end][inside]] = 255
+		return image
+
+
+# Intersect vertical rays through the pixel centers with the triangles.
+# Returns the pixel index (row * width + column) and the height of each
+# crossing. Each triangle is only tested against the pixels inside its
+# bounding box. Pixels are processed in batches to limit memory use.
+# Rays through shared edges and corners hit exactly one of the triangles
+# by using a top left fill rule like a rasteriser does.
+# Spacing may be given for x and y separately. If withTriangles is set,
+# the index of the crossed triangle is returned as well.
+def rayCrossings(points, triangles, origin, spacing, width, height, batchSize=1<<22, withTriangles=False):
+	spacingX, spacingY = numpy.broadcast_to(spacing, 2)
+	# Triangle corners in pixel coordinates.
+	corners = points[triangles]
+	x = (corners[:,:,0] - origin[0]) / spacingX
+	y = (corners[:,:,1] - origin[1]) / spacingY
+	z = corners[:,:,2]
+	# Twice the signed area. Make all triangles counter clockwise
+	# and drop vertical ones that no ray can hit.
+	area = (x[:,1]-x[:,0])*(y[:,2]-y[:,0]) - (x[:,2]-x[:,0])*(y[:,1]-y[:,0])
+	flip = area < 0
+	for values in (x, y, z):
+		values[flip,1], values[flip,2] = values[flip,2].copy(), values[flip,1].copy()
+	area = numpy.abs(area)
+	# Pixel bounding box of each triangle.
+	firstRows = numpy.maximum(numpy.ceil(y.min(axis=1)), 0).astype(numpy.int64)
+	lastRows = numpy.minimum(numpy.floor(y.max(axis=1)), height-1).astype(numpy.int64)
+	firstColumns = numpy.maximum(numpy.ceil(x.min(axis=1)), 0).astype(numpy.int64)
+	lastColumns = numpy.minimum(numpy.floor(x.max(axis=1)), width-1).astype(numpy.int64)
+	keep = numpy.flatnonzero((area > 0) & (lastRows >= firstRows) & (lastColumns >= firstColumns))
+	if len(keep) == 0:
+		if withTriangles:
+			return numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.float64), numpy.zeros(0, numpy.int64)
+		return numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.float64)
+	x, y, z, area = x[keep], y[keep], z[keep], area[keep]
+	firstRows, lastRows, firstColumns, lastColumns = firstRows[keep], lastRows[keep], firstColumns[keep], lastColumns[keep]
+	# Edges from corner i+1 to i+2 lie opposite of corner i.
+	# They are included if they are top or left edges.
+	dx = numpy.roll(x, -2, axis=1) - numpy.roll(x, -1, axis=1)
+	dy = numpy.roll(y, -2, axis=1) - numpy.roll(y, -1, axis=1)
+	topLeft = (dy < 0) | ((dy == 0) & (dx > 0))
+	# Split the bounding boxes into rows and the rows into batches.
+	numberOfRows = lastRows - firstRows + 1
+	rowTriangles = numpy.repeat(numpy.arange(len(keep)), numberOfRows)
+	rows = numpy.arange(len(rowTriangles)) - numpy.repeat(numpy.cumsum(numberOfRows) - numberOfRows, numberOfRows) + firstRows[rowTriangles]
+	rowLengths = lastColumns[rowTriangles] - firstColumns[rowTriangles] + 1
+	rowEnds = numpy.cumsum(rowLengths)
+	batches = numpy.searchsorted(rowEnds, numpy.arange(batchSize, rowEnds[-1], batchSize), side='left') + 1
+	pixels = []
+	heights = []
+	crossedTriangles = []
+	for batch in numpy.split(numpy.arange(len(rowTriangles)), batches):
+		if len(batch) == 0:
+			continue
+		# One candidate per pixel in the batch rows.
+		lengths = rowLengths[batch]
+		candidates = numpy.repeat(batch, lengths)
+		t = rowTriangles[candidates]
+		px = numpy.arange(len(candidates)) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths) + firstColumns[t]
+		py = rows[candidates]
+		# Edge functions. Positive inside for counter clockwise triangles.
+		inside = numpy.ones(len(candidates), bool)
+		weights = []
+		for i in range(3):
+			j = (i + 1) % 3
+			w = dx[t,i] * (py - y[t,j]) - dy[t,i] * (px - x[t,j])
+			inside &= (w > 0) | ((w == 0) & topLeft[t,i])
+			weights.append(w)
+		t = t[inside]
+		pixels.append((py * width + px)[inside])
+		heights.append((weights[0][inside]*z[t,0] + weights[1][inside]*z[t,1] + weights[2][inside]*z[t,2]) / area[t])
+		crossedTriangles.append(keep[t])
+	if len(pixels) == 0:
+		pixels, heights, crossedTriangles = [numpy.zeros(0, numpy.int64)], [numpy.zeros(0, numpy.float64)], [numpy.zeros(0, numpy.int64)]
+	if withTriangles:
+		return numpy.concatenate(pixels), numpy.concatenate(heights), numpy.concatenate(crossedTriangles)
+	return numpy.concatenate(pixels), numpy.concatenate(heights)
+
+
+# Cast vertical rays through a grid of points given like the pixels
+# of rayCrossings. Returns the height of the lowest crossing between zMin and
+# zMax for each point as array of shape (height, width). Points whose
+# ray does not hit any triangle are nan.
+def lowestRayHits(points, triangles, origin, spacing, width, height, zMin, zMax):
+	pixels, z = rayCrossings(points, triangles, origin, spacing, width, height)
+	inside = (z >= zMin) & (z <= zMax)
+	hits = numpy.empty(width * height)
+	hits.fill(numpy.inf)
+	numpy.minimum.at(hits, pixels[inside], z[inside])
+	hits[numpy.isinf(hits)] = numpy.nan
+	return hits.reshape(height, width)
+
+
+
+
+################################################################################
+# Support placement. ###########################################################
+################################################################################
+# Label the connected regions of a mesh. Triangles are connected if
+# they share a point. Returns the region of each triangle and the
+# number of regions.
+def connectedRegions(points, triangles):
+	if len(triangles) == 0:
+		return numpy.zeros(0, numpy.int64), 0
+	# Graph of the points connected by the triangle edges.
+	rows = triangles.ravel()
+	columns = triangles[:,[1,2,0]].ravel()
+	graph = sparse.coo_matrix((numpy.ones(len(rows)), (rows, columns)), shape=(len(points), len(points)))
+	numberOfRegions, pointRegions = csgraph.connected_components(graph, directed=False)
+	# Number the regions of used points only.
+	regions, triangleRegions = numpy.unique(pointRegions[triangles[:,0]], return_inverse=True)
+	return triangleRegions, len(regions)
+
+# Get the indices of the points that are lower than all their neighbours
+# and only have faces pointing downwards. These are the first points of an
+# island to be printed. Pits in upward facing surfaces are skipped.
+def localMinima(points, triangles):
+	neighbourMin = numpy.empty(len(points))
+	neighbourMin.fill(numpy.inf)
+	for i, j in ((0,1), (1,2), (2,0)):
+		numpy.minimum.at(neighbourMin, triangles[:,i], points[triangles[:,j],2])
+		numpy.minimum.at(neighbourMin, triangles[:,j], points[triangles[:,i],2])
+	# Z component of the face normals.
+	corners = points[triangles]
+	normalsZ = (corners[:,1,0]-corners[:,0,0])*(corners[:,2,1]-corners[:,0,1]) - (corners[:,2,0]-corners[:,0,0])*(corners[:,1,1]-corners[:,0,1])
+	downwards = numpy.ones(len(points), bool)
+	downwards[triangles[normalsZ >= 0].ravel()] = False
+	# Unused points keep an infinite neighbour height and are skipped.
+	return numpy.flatnonzero((points[:,2] < neighbourMin) & numpy.isfinite(neighbourMin) & downwards)
+
+
+# Get support points for the overhang of a model clustered by region.
+# The overhang is split into connected regions. Grid points get a support
+# at their lowest hit like for lowestRayHits. Regions with a footprint
+# smaller than one cell of the support grid are thinned to a single support
+# at their lowest point instead, unless a larger region above needs the grid
+# point. Regions the grid misses get a support at their lowest point and so
+# does every local minimum of the model the grid misses, as it would
+# otherwise start printing in mid air.
+# Returns the support heights on the grid with nan where there is no
+# support and the positions of the additional supports (k x 3).
+def clusteredSupportPoints(points, triangles, modelPoints, modelTriangles, origin, spacing, width, height, zMax):
+	spacingX, spacingY = numpy.broadcast_to(spacing, 2)
+	hits = numpy.empty(width * height)
+	hits.fill(numpy.nan)
+	regions, numberOfRegions = connectedRegions(points, triangles)
+	# Footprint area of each region.
+	corners = points[triangles]
+	areas = numpy.abs((corners[:,1,0]-corners[:,0,0])*(corners[:,2,1]-corners[:,0,1]) - (corners[:,2,0]-corners[:,0,0])*(corners[:,1,1]-corners[:,0,1])) / 2.
+	large = numpy.bincount(regions, weights=areas, minlength=numberOfRegions) >= spacingX * spacingY
+	# Lowest hit of each grid point and its region.
+	pixels, z, crossed = rayCrossings(points, triangles, origin, spacing, width, height, withTriangles=True)
+	inside = (z >= 0) & (z <= zMax)
+	pixels, z, crossedRegions = pixels[inside], z[inside], regions[crossed[inside]]
+	order = numpy.lexsort((z, pixels))
+	first = order[numpy.r_[True, pixels[order][1:] != pixels[order][:-1]]] if len(order) else order
+	# Keep grid points of large regions and those below a large region.
+	keep = large[crossedRegions[first]] | numpy.in1d(pixels[first], pixels[large[crossedRegions]])
+	first = first[keep]
+	hits[pixels[first]] = z[first]
+	hits = hits.reshape(height, width)
+	# Lowest point of each region the grid misses.
+	missed = numpy.ones(numberOfRegions, bool)
+	missed[crossedRegions[first]] = False
+	cornerRegions = numpy.repeat(regions, 3)
+	cornerPoints = triangles.ravel()
+	order = numpy.lexsort((points[cornerPoints,2], cornerRegions))
+	lowest = order[numpy.r_[True, cornerRegions[order][1:] != cornerRegions[order][:-1]]] if len(order) else order
+	islands = points[cornerPoints[lowest[missed[cornerRegions[lowest]]]]]
+	# Local minima the grid misses.
+	minima = modelPoints[localMinima(modelPoints, modelTriangles)]
+	iX = numpy.round((minima[:,0] - origin[0]) / spacingX).astype(numpy.int64)
+	iY = numpy.round((minima[:,1] - origin[1]) / spacingY).astype(numpy.int64)
+	onGrid = (iX >= 0) & (iX < width) & (iY >= 0) & (iY < height)
+	onGrid[onGrid] = ~numpy.isnan(hits[iY[onGrid], iX[onGrid]])
+	islands = numpy.vstack((islands, minima[~onGrid]))
+	islands = islands[(islands[:,2] > 0) & (islands[:,2] <= zMax)]
+	# Keep the lowest of islands closer than half a grid cell.
+	islands = islands[numpy.argsort(islands[:,2], kind='mergesort')]
+	cells = numpy.floor(islands[:,:2] / (numpy.array([spacingX, spacingY]) / 2.)).astype(numpy.int64)
+	cells = cells[:,0] * 1000003 + cells[:,1]
+	unique, keep = numpy.unique(cells, return_index=True)
+	return hits, islands[numpy.sort(keep)]
+
+
+# Get a hash of the triangles cut at each of the given slice positions.
+# Returns an array of two 64 bit hashes per slice position.
+# Every triangle gets its own hash from its point coordinates. The hashes
+# of all triangles cut by a plane are summed up so that a change of a
+# triangle only changes the hashes of the layers it spans.
+# Slice positions have to be sorted ascending.
+def layerHashes(points, triangles, slicePositions):
+	if len(triangles) == 0:
+		return numpy.zeros((len(slicePositions), 2), numpy.uint64)
+	# Hash the coordinates of each triangle.
+	triangleHashes = hashRows(points[triangles].reshape(-1,9))
+	# Find the range of slices each triangle is cut by.
+	zTriangles = points[triangles,2]
+	first = numpy.searchsorted(slicePositions, zTriangles.min(axis=1), side='right')
+	last = numpy.searchsorted(slicePositions, zTriangles.max(axis=1), side='right')
+	return sumRangeHashes(triangleHashes, first, last, len(slicePositions))
+
+# Get two 64 bit hashes for each row of a 2d array of numbers.
+def hashRows(values):
+	values = numpy.ascontiguousarray(values, dtype=numpy.float64).view(numpy.uint64)
+	hashes = numpy.zeros((len(values), 2), numpy.uint64)
+	for lane, seed in enumerate((0x9e3779b97f4a7c15, 0xc2b2ae3d27d4eb4f)):
+		value = numpy.zeros(len(values), numpy.uint64)
+		for i in range(values.shape[1]):
+			value = (value ^ values[:,i]) * numpy.uint64(seed)
+			value = value ^ (value >> numpy.uint64(29))
+		hashes[:,lane] = value
+	return hashes
+
+# Sum up the hashes of items that span the slices from first to
+# before last for each slice.
+def sumRangeHashes(itemHashes, first, last, numberOfSlices):
+	hashes = numpy.zeros((numberOfSlices+1, 2), numpy.uint64)
+	# Add the item hash at the first slice, remove it after the last
+	# and sum up. Overflows wrap around so this works for any hash.
+	numpy.add.at(hashes, first, itemHashes)
+	numpy.subtract.at(hashes, last, itemHashes)
+	return numpy.cumsum(hashes, axis=0, dtype=numpy.uint64)[:-1]
+
+
+
+
+################################################################################
+# Stl files. ###################################################################
+################################################################################
+# Layout of a triangle in a binary stl file.
+stlDtype = numpy.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3,3)), ('attribute', '<u2')])
+
+# Read the triangle corners of a binary or ascii stl file.
+# Returns an array of all corners (3m x 3, float32).
+def readStlVertices(filename):
+	with open(filename, 'rb') as f:
+		f.seek(80)
+		count = numpy.fromfile(f, '<u4', count=1)
+		f.seek(0, 2)
+		size = f.tell()
+		# Binary files are at least as large as their triangle count says.
+		# Some have trailing bytes. Ascii files may start with 'solid' but
+		# their text gives a count far beyond the file size.
+		if len(count) and size >= 84 + int(count[0]) * stlDtype.itemsize:
+			f.seek(84)
+			data = numpy.fromfile(f, stlDtype, count=int(count[0]))
+			return numpy.ascontiguousarray(data['vertices']).reshape(-1,3)
+	# Read ascii files in chunks of lines and only parse the vertex lines.
+	values = []
+	with open(filename, 'r') as f:
+		while True:
+			lines = f.readlines(1 << 24)
+			if not lines:
+				break
+			vertexLines = [line.lstrip()[6:] for line in lines if line.lstrip().startswith('vertex')]
+			chunk = numpy.fromstring(' '.join(vertexLines), dtype=numpy.float32, sep=' ')
+			if len(chunk) != 3 * len(vertexLines):
+				raise ValueError("Invalid vertex in ascii stl file")
+			values.append(chunk)
+	if len(values) == 0:
+		return numpy.zeros((0,3), numpy.float32)
+	return numpy.concatenate(values).reshape(-1,3)
+
+
+# Merge identical corners into shared points.
+# Returns points and triangles. Triangles are the rows of a vtk cell array
+# ([3, id, id, id]) so that they can be passed to vtk without copying.
+# Degenerate triangles are removed.
+def weldVertices(vertices):
+	if len(vertices) == 0:
+		return numpy.zeros((0,3), numpy.float32), numpy.zeros((0,4), numpy_support.ID_TYPE_CODE)
+	# Compare corners by their bits. Adding zero turns -0 into 0.
+	vertices = numpy.ascontiguousarray(vertices + numpy.float32(0), numpy.float32)
+	bits = vertices.view(numpy.uint32).astype(numpy.uint64)
+	# Sorting a hash of the corners is much faster than sorting rows.
+	keys = (bits[:,0] * numpy.uint64(0x9E3779B97F4A7C15)) ^ (bits[:,1] * numpy.uint64(0xC2B2AE3D27D4EB4F)) ^ bits[:,2]
+	order = numpy.argsort(keys)
+	first = numpy.empty(len(keys), bool)
+	first[0] = True
+	keys = keys[order]
+	numpy.not_equal(keys[1:], keys[:-1], out=first[1:])
+	inverse = numpy.empty(len(keys), numpy.int64)
+	inverse[order] = numpy.cumsum(first) - 1
+	points = vertices[order[first]]
+	# Sort the rows themselves if different corners have the same hash.
+	if not (points[inverse] == vertices).all():
+		order = numpy.lexsort((bits[:,2], bits[:,1], bits[:,0]))
+		bits = bits[order]
+		first[1:] = numpy.any(bits[1:] != bits[:-1], axis=1)
+		inverse[order] = numpy.cumsum(first) - 1
+		points = vertices[order[first]]
+	cells = numpy.empty((len(vertices) // 3, 4), numpy_support.ID_TYPE_CODE)
+	cells[:,0] = 3
+	cells[:,1:] = inverse.reshape(-1,3)
+	valid = (cells[:,1] != cells[:,2]) & (cells[:,2] != cells[:,3]) & (cells[:,3] != cells[:,1])
+	return points, cells[valid]
+
+
+# Read an stl file into points and triangle cells, see weldVertices.
+def readStl(filename):
+	return weldVertices(readStlVertices(filename))
+
+
+# Create polydata that uses the memory of the given points and cells.
+# The arrays must be kept alive as long as the polydata is in use.
+def sharedPolydata(points, cells):
+	points = numpy.ascontiguousarray(points)
+	cells = numpy.ascontiguousarray(cells, numpy_support.ID_TYPE_CODE)
+	vtkPoints = vtk.vtkPoints()
+	vtkPoints.SetData(numpy_support.numpy_to_vtk(points, deep=0))
+	vtkCells = vtk.vtkCellArray()
+	vtkCells.SetCells(len(cells), numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(), deep=0))
+	polydata = vtk.vtkPolyData()
+	polydata.SetPoints(vtkPoints)
+	polydata.SetPolys(vtkCells)
+	return polydata
@@ -29,16 +29,27 @@ import time
 import random
 import Image#, ImageTk
 import Queue, threading
+import collections
+import multiprocessing
 import monkeyprintImageHandling as imageHandling
+import monkeyprintMeshHandling as meshHandling
+import monkeyprintSliceCache
 import gtk
 import cPickle	# Save modelCollection to file.
 import gzip
+import tempfile
+import hashlib
 import tarfile
+import json
 
 import monkeyprintSettings
 
+
+# Model settings that the supports depend on.
+supportSettingsKeys = ['Overhang angle', 'Spacing X', 'Spacing Y', 'Maximum height', 'Support regions', 'Base diameter', 'Tip diameter', 'Cone height']
+
 class modelContainer:
-	def __init__(self, filenameOrSettings, programSettings, console=None):
+	def __init__(self, filenameOrSettings, programSettings, console=None, modelId=None):
 	
 		# Check if a filename has been given or an existing model settings object.
 		# If filename was given...
@@ -60,7 +71,7 @@ class modelContainer:
 		self.console=console
 		
 		# Create model object.
-		self.model = modelData(filename, self.settings, programSettings, self.console)
+		self.model = modelData(filename, self.settings, programSettings, self.console, modelId)
 		
 		# Active flag. Only do updates if model is active.
 		self.flagActive = True
@@ -90,10 +101,10 @@ class modelContainer:
 		#self.model.setChanged()
 		self.model.updateModel()	
 	
-	def updateSupports(self):
+	def updateSupports(self, force=False):
 		#self.model.setChanged()
 		self.model.updateBottomPlate()
-		self.model.updateSupports()
+		self.model.updateSupports(force)
 		
 	def updateSlice3d(self, sliceNumber):
 		self.model.updateSlice3d(sliceNumber)
@@ -510,6 +521,11 @@ class modelCollection(dict):
 				# Make the model file path point to the tmp directory.
 				modelFilename = settingsList[model]['filename'].value.split('/')[-1]
 				settingsList[model]['filename'].value = tmpPath+'/'+modelFilename
+				# Add settings that projects from older versions don't have.
+				defaults = monkeyprintSettings.modelSettings()
+				for key in defaults:
+					if key not in settingsList[model]:
+						settingsList[model][key] = defaults[key]
 				# Create a new model from the modelId and settings.
 				self.add(model, settingsList[model])
 				self.getCurrentModel().hideBox()
@@ -541,7 +557,7 @@ class modelCollection(dict):
 	
 	# Add a model to the collection.
 	def add(self, modelId, filenameOrSettings):
-		self[modelId] = modelContainer(filenameOrSettings, self.programSettings, self.console)
+		self[modelId] = modelContainer(filenameOrSettings, self.programSettings, self.console, modelId)
 		# Set new model as current model.
 		self.currentModelId = modelId
 	
@@ -609,11 +625,22 @@ class modelCollection(dict):
 		# Get slice images from models.
 		# Append the slice image and its position on the projector frame.
 		imgList = []
+		# Run length encoded slices are composited directly from their runs.
+		runList = []
 		for model in self:
 	#		self[model].updateSlice3d(sliceNumber)
 			if model != "default" and self[model].isActive() and i<len(self[model].model.sliceStack):
 	#			print "Image dimensions: " + str(self[model].model.sliceStack[i].shape) + "."
-				imgList.append((self[model].model.sliceStack[i], self[model].model.getSlicePosition()))
+				self[model].model.setSliceFocus(i)
+				image = self[model].model.sliceStack.getSliceData(i)
+				if isinstance(image, imageHandling.runLengthImage):
+					if not image.isEmpty():
+						runList.append(image.getRuns(self[model].model.getSlicePosition(), self.sliceImage.shape))
+				else:
+					imgList.append((self[model].model.sliceStack.getImage(i), self[model].model.getSlicePosition()))
+		# Add runs to projector frame.
+		if len(runList):
+			self.sliceImage = imageHandling.compositeRuns(self.sliceImage, runList)
 		# Add list of slice images to projector frame.
 		for i in range(len(imgList)):
 			self.sliceImage = imageHandling.imgAdd(self.sliceImage, imgList[i][0], imgList[i][1])
@@ -695,6 +722,16 @@ class modelCollection(dict):
 		 # Return true, otherwise the function will not run again.
 		return True
 	
+	# Check if the given slices of all active models are ready for printing.
+	# Slices are ready once the slicer has written them to the stack.
+	def slicesReady(self, start, stop):
+		for model in self:
+			if model != "default" and self[model].isActive():
+				for sliceNumber in range(start, stop):
+					if not self[model].model.isSliceReady(sliceNumber):
+						return False
+		return True
+	
 	def slicerRunning(self):
 		# Return True if one of the slicers is still running.
 		running = False
@@ -820,7 +857,7 @@ class modelData:
 	# Construction method definition. #########################################
 	###########################################################################
 	
-	def __init__(self, filename, settings, programSettings, console=None):
+	def __init__(self, filename, settings, programSettings, console=None, modelId=None):
 	
 		# Create VTK error observer to catch errors.
 		self.errorObserver = ErrorObserver()
@@ -829,6 +866,7 @@ class modelData:
 		# Internalise settings.
 		self.filenameStl = ""
 		self.filename = filename
+		self.modelId = modelId
 		self.flagActive = True
 		self.settings = settings
 		self.programSettings = programSettings
@@ -845,11 +883,19 @@ class modelData:
 		
 		# Set up the slice stack. Has one slice only at first...
 		self.sliceStack = sliceStack()
+		# Slices of the running slicer job that are final.
+		self.slicesReady = []
+		# Stage times of the last slicer job.
+		self.sliceTimings = sliceTimer()
 		self.slicePosition = (0,0)
+		# Triangle index of the positioned model for the slicer.
+		self.triangleIndex = None
 	
 		# Background thread for updating the slices on demand.
 		self.queueSlicerIn = Queue.Queue()
 		self.queueSlicerOut = Queue.Queue()
+		# Cancel token of the current slicer job.
+		self.slicerJob = None
 		if self.filename != "":
 			# Initialise the thread.
 			if self.console!=None:
@@ -870,12 +916,18 @@ class modelData:
 		# --> Intersect support pattern with overhang model.
 		# --> Create supports on intersection points.
 		if self.filename != "":
-			# Create stl source.
-			self.stlReader = vtk.vtkSTLReader() # File name will be set later on when model is actually loaded.	
-			self.stlReader.SetFileName(self.filename)
+			# Hash the stl file for the slice cache.
+			self.stlHash = monkeyprintSliceCache.hashFile(self.filename)
+			# Read the stl file into welded point and triangle arrays.
+			# Keep the arrays as the polydata uses their memory.
+			try:
+				self.stlMesh = meshHandling.readStl(self.filename)
+			except (IOError, ValueError), error:
+				if self.console:
+					self.console.addLine("Could not read stl file: " + str(error) + ".")
+				self.stlMesh = meshHandling.weldVertices(numpy.zeros((0,3), numpy.float32))
 			# Get polydata from stl file.
-			self.stlPolyData = vtk.vtkPolyData
-			self.stlPolyData = self.stlReader.GetOutput()
+			self.stlPolyData = meshHandling.sharedPolydata(*self.stlMesh)
 			# Calculate normals.
 			self.stlPolyDataNormals = vtk.vtkPolyDataNormals()
 			self.stlPolyDataNormals.SetInput(self.stlPolyData)
@@ -909,13 +961,16 @@ class modelData:
 			self.overhangClipFilter.SetInsideOut(1)
 			self.overhangClipFilter.GenerateClippedOutputOff()
 			self.overhangClipFilter.SetInput(self.stlPositionFilter.GetOutput())
-			# Define cell locator for intersections of support pattern and overhang model.
-			self.locator = vtk.vtkCellLocator()
-			self.locator.SetDataSet(self.overhangClipFilter.GetOutput())	#TODO: change to selected region input.
 		
 			# Create supports polydata.
 			self.supports = vtk.vtkAppendPolyData()
 			self.supports.AddObserver('ErrorEvent', self.errorObserver)
+			# Support dimensions for the slicer, one row per support.
+			self.supportTable = supportGeometry().supports
+			# Inputs of the current supports and number of rebuilds.
+			# Supports are only rebuilt if their inputs change.
+			self.supportInputKey = None
+			self.supportGeneration = 0
 
 			# Create bottom plate polydata. Edge length 1 mm, place outside of build volume by 1 mm.	
 			self.bottomPlate = vtk.vtkCubeSource()
@@ -1033,12 +1088,24 @@ class modelData:
 			self.overhangClipActor.SetMapper(self.overhangClipMapper)
 
 		# Create supports mapper. ********************************************
-		# TODO: this throws empty pipeline errors on instatiation as self.supports does not have any input yet.
-		self.supportsMapper = vtk.vtkPolyDataMapper()
+		# Supports are rendered as glyphs. The template cone and cylinder
+		# are scaled and placed at each point of the glyph polydata.
+		self.supportGlyphs = vtk.vtkPolyData()
+		self.supportsMapper = vtk.vtkGlyph3DMapper()
+		templates = [meshHandling.trianglesToPolydata(*template) for template in supportGeometry.getTemplates()]
 		if vtk.VTK_MAJOR_VERSION <= 5 and self.filename != "":
-			self.supportsMapper.SetInput(self.supports.GetOutput())
+			self.supportsMapper.SetInput(self.supportGlyphs)
+			for index in range(len(templates)):
+				self.supportsMapper.SetSource(index, templates[index])
 		elif self.filename != "":
-			self.supportsMapper.SetInputConnection(self.supports.GetOutput())
+			self.supportsMapper.SetInputData(self.supportGlyphs)
+			for index in range(len(templates)):
+				self.supportsMapper.SetSourceData(index, templates[index])
+		self.supportsMapper.SetScaleArray('scale')
+		self.supportsMapper.SetScaleModeToScaleByVectorComponents()
+		self.supportsMapper.SetSourceIndexArray('source')
+		self.supportsMapper.SourceIndexingOn()
+		self.supportsMapper.OrientOff()
 		# Create supports actor.
 		self.supportsActor = vtk.vtkActor()
 		if self.filename != "":
@@ -1225,6 +1292,18 @@ class modelData:
 		self.flagChanged = True
 
 
+	# Get everything the supports depend on: the model
+	# transformations and the support settings.
+	def getSupportInputKey(self):
+		transforms = [self.stlCenterTransform, self.stlScaleTransform, self.stlRotateTransform, self.stlPositionTransform]
+		matrices = tuple([tuple([transform.GetMatrix().GetElement(i/4, i%4) for i in range(16)]) for transform in transforms])
+		return (matrices, tuple([self.settings[key].value for key in supportSettingsKeys]))
+
+	# Get the number of times the supports have been rebuilt.
+	def getSupportGeneration(self):
+		return self.supportGeneration
+
+
 
 	###########################################################################
 	# Update methods. #########################################################
@@ -1289,6 +1368,9 @@ class modelData:
 			self.stlPositionTransform.Translate(  ((self.__getSize(self.stlRotationFilter)[0]/2 + clearRangeX * (self.settings['Position X'].value / 100.0)) - self.stlPositionTransform.GetPosition()[0]) + self.programSettings['Model safety distance'].value,      ((self.__getSize(self.stlRotationFilter)[1]/2 + clearRangeY * (self.settings['Position Y'].value / 100.0)) - self.stlPositionTransform.GetPosition()[1]) + self.programSettings['Model safety distance'].value,       self.__getSize(self.stlRotationFilter)[2]/2 - self.stlPositionTransform.GetPosition()[2] + self.settings['Bottom clearance'].value)
 			self.stlPositionFilter.Update()
 
+			# Index the positioned model's triangles by height for the slicer.
+			self.triangleIndex = meshHandling.triangleIndex(*meshHandling.polydataToTriangles(self.stlPositionFilter.GetOutput()))
+
 			# Recalculate normals.
 			self.getNormalZComponent(self.stlPositionFilter.GetOutput())
 
@@ -1329,32 +1411,18 @@ class modelData:
 
 
 	# Update supports. ########################################################
-	def updateSupports(self):
+	# Supports are only rebuilt if their inputs have changed or if forced.
+	def updateSupports(self, force=False):
 
 		if self.filename != "" and self.isActive():
+			# Skip if nothing the supports depend on has changed.
+			inputKey = self.getSupportInputKey()
+			if inputKey == self.supportInputKey and not force:
+				return
+
 			# Update overhang.
 			self.updateOverhang()
 
-			# Clear all inputs from cones data.
-			self.supports.RemoveAllInputs()
-			
-			# Create one super small cone to have at least one input
-			# to the vtkAppendPolyData in case no model intersections
-			# were found.
-			cone = vtk.vtkConeSource()
-			# Set cone dimensions.
-			cone.SetRadius(.01)
-			cone.SetHeight(.01)
-			cone.SetResolution(6)
-			cone.SetCenter([-.1,-.1,-.1])
-			self.supports.AddInput(cone.GetOutput())
-
-	#TODO: Add support regions using	overhangRegionFilter.Update();
-	
-			# Update the cell locator.
-			self.locator.BuildLocator()
-			self.locator.Update()	
-
 			# Get overhang bounds to set up support pattern.
 			# Bounds are absolute coordinates.
 			bounds = [0 for i in range(6)]
@@ -1382,97 +1450,83 @@ class modelData:
 			# Number of points in X and Y.
 			nX = nXMin + nXMax + 1	# +1 because of center support, nXMin and nXMax only give number of supports to each side of center.
 			nY = nYMin + nYMax + 1	# +1 because of center support...
-		#	i = 0
-			# Loop through point grid and check for intersections.
-			for iX in range(nX):
-				for iY in range(nY):
-					# Get X and Y values.
-					pointX = startX + iX * self.settings['Spacing X'].value
-					pointY = startY + iY * self.settings['Spacing Y'].value
-				
-					# Combine to bottom and top point.
-					pointBottom = [pointX, pointY, 0]
-					pointTop = [pointX, pointY, self.settings['Maximum height'].value]
-				
-					# Create outputs for intersector.
-					t = vtk.mutable(0)			# not needed.
-					pos = [0.0, 0.0, 0.0]		# that's what we're looking for.
-					pcoords = [0.0, 0.0, 0.0]	# not needed.
-					subId = vtk.mutable(0)		# not needed.
-					tolerance = 0.001
-		
-					# Intersect.
-					self.locator.IntersectWithLine(pointBottom, pointTop, tolerance, t, pos, pcoords, subId)
-
-					# Create cone if intersection point found.
-					if pos != [0,0,0]:
-						# Create cone.
-						cone = vtk.vtkConeSource()
-						# Set cone dimensions.
-						cone.SetRadius(self.settings['Base diameter'].value/2.0)
-						cone.SetHeight(self.settings['Cone height'].value)
-						cone.SetResolution(20)
-						# Set cone position (at cone center) according to current point.
-						pos[2] = pos[2]-self.settings['Cone height'].value/2.0
-						# Adjust cone Z position to meet tip connection diameter.
-						pos[2] = pos[2]+1.0*self.settings['Cone height'].value/(1.0*self.settings['Base diameter'].value/self.settings['Tip diameter'].value)
-						cone.SetCenter(pos)
-					
-						# Rotate the cone tip upwards.
-						coneRotation = vtk.vtkRotationFilter()
-						coneRotation.SetInput(cone.GetOutput())
-						coneRotation.SetAxisToY()
-						coneRotation.SetCenter(pos)
-						coneRotation.SetAngle(-90)
-						coneRotation.SetNumberOfCopies(1)
-						coneRotation.CopyInputOff()
-					
-						# Use a geometry filter to convert rotation filter output
-						# from unstructuredGrid to polyData.
-						coneGeomFilter = vtk.vtkGeometryFilter()
-						coneGeomFilter.SetInput(coneRotation.GetOutput())
-						coneGeomFilter.Update()
-					
-						# Create cylinder.
-						cylinder = vtk.vtkCylinderSource()
-						# Set cylinder dimensions.
-						cylinder.SetRadius(self.settings['Base diameter'].value/2.0)
-						cylinder.SetHeight(pos[2]-self.settings['Cone height'].value/2.0)
-						cylinder.SetResolution(20)
-					
-						# Set cylinder position.
-						# Adjust height to fit beneath corresponding cone.
-						pos[2] = (pos[2]-self.settings['Cone height'].value/2.0)/2.0
-						cylinder.SetCenter(pos)
-		
-						# Rotate the cone tip upwards.
-						cylinderRotation = vtk.vtkRotationFilter()
-						cylinderRotation.SetInput(cylinder.GetOutput())
-						cylinderRotation.SetAxisToX()
-						cylinderRotation.SetCenter(pos)
-						cylinderRotation.SetAngle(-90)
-						cylinderRotation.SetNumberOfCopies(1)
-						cylinderRotation.CopyInputOff()
-	
-						# Use a geometry filter to convert rotation filter output
-						# from unstructuredGrid to polyData.
-						cylinderGeomFilter = vtk.vtkGeometryFilter()
-						cylinderGeomFilter.SetInput(cylinderRotation.GetOutput())
-						cylinderGeomFilter.Update()
-		
-						# Append the cone to the cones polydata.
-						self.supports.AddInput(coneGeomFilter.GetOutput())
-						# Delete the cone. Vtk delete() method does not work in python because of garbage collection.
-						del cone
-						# Append the cylinder to the cones polydata.
-						self.supports.AddInput(cylinderGeomFilter.GetOutput())
-						del cylinder
-		#				i += 1
-		#	print "Created " + str(i) + " supports."
+
+			# Cast rays upwards from all points of the grid at once and get
+			# the lowest intersection with the overhang for each.
+			points, triangles = meshHandling.polydataToTriangles(self.overhangClipFilter.GetOutput())
+			spacing = (self.settings['Spacing X'].value, self.settings['Spacing Y'].value)
+			if self.settings['Support regions'].value:
+				# Place supports per overhang region and at islands.
+				if self.triangleIndex != None:
+					modelPoints, modelTriangles = self.triangleIndex.points, self.triangleIndex.triangles
+				else:
+					modelPoints, modelTriangles = meshHandling.polydataToTriangles(self.stlPositionFilter.GetOutput())
+				hits, islands = meshHandling.clusteredSupportPoints(points, triangles, modelPoints, modelTriangles, (startX, startY), spacing, nX, nY, self.settings['Maximum height'].value)
+			else:
+				hits = meshHandling.lowestRayHits(points, triangles, (startX, startY), spacing, nX, nY, 0, self.settings['Maximum height'].value)
+				islands = numpy.zeros((0,3))
+
+			# Create a support at each intersection point and island.
+			# Supports are kept as table of their dimensions.
+			iX, iY = numpy.nonzero(~numpy.isnan(hits.T))
+			supportRows = numpy.empty((len(iX) + len(islands), len(supportGeometry.columns)))
+			supportRows[:len(iX),0] = startX + iX * spacing[0]
+			supportRows[:len(iX),1] = startY + iY * spacing[1]
+			supportRows[:len(iX),2] = hits[iY, iX]
+			supportRows[len(iX):,:3] = islands
+			supportRows[:,3] = self.settings['Base diameter'].value/2.0
+			supportRows[:,4] = self.settings['Tip diameter'].value/2.0
+			supportRows[:,5] = self.settings['Cone height'].value
+			geometry = supportGeometry(supportRows)
+			self.supportTable = geometry.supports
+
+			# Create the supports mesh from template cones and cylinders.
+			self.supports.RemoveAllInputs()
+			if len(self.supportTable):
+				self.supports.AddInput(meshHandling.trianglesToPolydata(*geometry.getMesh()))
+			else:
+				# Create one super small cone to have at least one input
+				# to the vtkAppendPolyData in case no model intersections
+				# were found.
+				cone = vtk.vtkConeSource()
+				# Set cone dimensions.
+				cone.SetRadius(.01)
+				cone.SetHeight(.01)
+				cone.SetResolution(6)
+				cone.SetCenter([-.1,-.1,-.1])
+				self.supports.AddInput(cone.GetOutput())
+			self.updateSupportGlyphs(geometry)
+			self.supportInputKey = inputKey
+			self.supportGeneration += 1
+			# The slices have to be updated for the new supports.
+			self.setChanged()
 			self.modelBoundingBoxTextActor.SetCaption("x: %6.2f mm\ny: %6.2f mm\nz: %6.2f mm\nVolume: %6.2f ml"	% (self.getSize()[0], self.getSize()[1], self.getSize()[2], self.getVolume()) )
 
 		
 		
+	# Place the support glyphs for the 3D view.
+	def updateSupportGlyphs(self, geometry):
+		positions, scales, sources = geometry.getGlyphs()
+		points = vtk.vtkPoints()
+		# Remove the arrays of the last supports.
+		self.supportGlyphs.GetPointData().Initialize()
+		if len(positions):
+			points.SetData(numpy_support.numpy_to_vtk(numpy.ascontiguousarray(positions), deep=1))
+			scaleArray = numpy_support.numpy_to_vtk(numpy.ascontiguousarray(scales), deep=1)
+			scaleArray.SetName('scale')
+			self.supportGlyphs.GetPointData().AddArray(scaleArray)
+			sourceArray = numpy_support.numpy_to_vtk(sources.astype(numpy.int32), deep=1)
+			sourceArray.SetName('source')
+			self.supportGlyphs.GetPointData().AddArray(sourceArray)
+		self.supportGlyphs.SetPoints(points)
+		self.supportGlyphs.Modified()
+
+
+	# Get supports and bottom plate dimensions for the slicer.
+	def getSupportGeometry(self):
+		return supportGeometry(self.supportTable, tuple(self.bottomPlate.GetOutput().GetBounds()))
+
+
 	# Update slice actor.
 	def updateSlice3d(self, sliceNumber):		
 		if self.filename != "" and self.isActive():
@@ -1491,33 +1545,117 @@ class modelData:
 		# Only update if this is not default flag and the 
 		# model or supports have been changed before.
 		if self.filename!="" and self.flagChanged and self.isActive():
+			# In lazy mode, only set up the pipeline.
+			# Slices will be created once they are requested.
+			if self.programSettings['Lazy slicing'].value:
+				if self.console != None:
+					self.console.addLine('Lazy slicing enabled.')
+				# Cancel the background slicer. Its output is ignored
+				# from now on. It may still run for a while, so the lazy
+				# stack gets a triangle index with its own sweep states.
+				self.slicerThread.cancel()
+				self.slicerJob = None
+				self.flagSlicerRunning = False
+				index = self.triangleIndex.copy() if self.triangleIndex != None else None
+				pipeline = slicePipeline(self.settings, self.programSettings, self.console)
+				pipeline.setInput([self.stlPositionFilter.GetOutput(), self.supports.GetOutput(), self.bottomPlate.GetOutput(), index, self.getSupportGeometry()])
+				# Single layers can't be hollowed in 3D, so use 2D hollowing.
+				pipeline.volumeHollowing = False
+				stackFile = createSliceStackFile(self.programSettings, pipeline.numberOfSlices, (pipeline.height, pipeline.width))
+				self.sliceStack.setLazy(pipeline, self.programSettings['Prefetch layers'].value, self.programSettings['Slice storage'].value, stackFile)
+				self.flagChanged = False
+				return
 			if self.console != None:
 				self.console.addLine('Slicer started.')
 			# Reset the slice stack.
 			self.sliceStack.reset(self.getSliceSize()[0], self.getSliceSize()[1], self.getNumberOfSlices())
-			# If there's nothing in the queue...
-			if self.queueSlicerIn.empty():
-				# ... write the model polydata to the queue.
-				self.queueSlicerIn.put([self.stlPositionFilter.GetOutput(), self.supports.GetOutput(), self.bottomPlate.GetOutput()])
+			self.slicesReady = [False for i in range(len(self.sliceStack))]
+			# Send the model polydata to the slicer. This cancels a running job.
+			# The slicer will load the slices from the cache if possible.
+			cacheKey = monkeyprintSliceCache.getCacheKey(self.stlHash, self.settings, self.programSettings)
+			self.slicerJob = self.slicerThread.submit([self.stlPositionFilter.GetOutput(), self.supports.GetOutput(), self.bottomPlate.GetOutput(), self.triangleIndex, self.getSupportGeometry()], cacheKey)
 			self.flagChanged = False
 			self.flagSlicerRunning = True
 
 
-	# Listen for the slicer threads output if it has finished.
+	# Listen for the slicer threads output.
+	# Finished slices are written to the stack as they come in.
 	def checkBackgroundSlicer(self):
-		# If a slice stack is in the output queue...
-		if self.queueSlicerOut.qsize():
-			# ... get it.
-			if self.console != None:
-				self.console.addLine('Slicer done.')
-			self.sliceStack[:] = self.queueSlicerOut.get()
-			self.flagSlicerRunning = False
+		while self.queueSlicerOut.qsize():
+			message = self.queueSlicerOut.get()
+			# Ignore output of cancelled jobs and don't overwrite
+			# a lazy stack that was set up in the meantime.
+			if message[1] != self.slicerJob or self.sliceStack.pipeline != None:
+				continue
+			# Single slice. Slices that will be replaced later on,
+			# e.g. before 3D hollowing, are not ready for printing.
+			if message[0] == 'slice':
+				if message[2] < len(self.sliceStack):
+					self.sliceStack[message[2]] = message[3]
+					self.slicesReady[message[2]] = message[4]
+			# Whole stack if the slicer has finished.
+			elif message[0] == 'done':
+				if self.console != None:
+					self.console.addLine('Slicer done.')
+				self.sliceStack[:] = message[2]
+				self.flagSlicerRunning = False
+				self.sliceTimings.reset()
+				self.sliceTimings.merge(message[3])
+				self.reportSliceTimings()
+	
+	
+	# Get the stage times of the slicer.
+	# In lazy mode these are the times of the slices created so far.
+	def getSliceTimings(self):
+		if self.sliceStack.pipeline != None:
+			return self.sliceStack.pipeline.timer
+		return self.sliceTimings
+	
+	# Show a summary of the stage times in debug mode and
+	# write them to the timing file if one is set.
+	def reportSliceTimings(self):
+		timings = self.getSliceTimings()
+		if self.programSettings['Debug'].value:
+			for line in timings.getSummaryText():
+				if self.console != None:
+					self.console.addLine(line)
+				else:
+					print line
+		if self.programSettings['Slice timing file'].value != '':
+			try:
+				timings.save(self.getSliceTimingFilename())
+			except IOError, error:
+				print "Could not write slice timings: " + str(error) + "."
+	
+	# Get the timing file of this model. The model id is added to the
+	# file name from the settings so models don't overwrite each other.
+	def getSliceTimingFilename(self):
+		filename = self.programSettings['Slice timing file'].value
+		if self.modelId == None:
+			return filename
+		root, extension = os.path.splitext(filename)
+		return root + '-' + str(self.modelId).replace(os.sep, '_') + extension
+	
+	
+	# Check if a slice is ready for printing.
+	# Lazy stacks create their slices on demand, so they are always ready.
+	def isSliceReady(self, sliceNumber):
+		if not self.flagSlicerRunning or self.sliceStack.pipeline != None or sliceNumber >= len(self.slicesReady):
+			return True
+		return self.slicesReady[sliceNumber]
+	
+	
+	# Set the layer the user is looking at. The slicer will do this one first.
+	def setSliceFocus(self, sliceNumber):
+		if self.filename != "":
+			self.slicerThread.setFocus(sliceNumber)
 	
 	
 	
 	
 	def killBackgroundSlicer(self):
 		self.slicerThread.stop()
+		self.sliceStack.stopPrefetcher()
 		
 		
 		
@@ -1791,6 +1929,20 @@ class sliceStack(list):
 		self.createDummyImages()	
 		# Create the slice array with a first black image.
 		self.append(self.imagesNoisy[0])
+		# Pipeline for lazy slicing. Slices will be created on
+		# demand if set, otherwise the stack holds all slices.
+		self.pipeline = None
+		# Lock for the pipeline and the lazy slices.
+		self.lock = threading.Lock()
+		# Prefetcher thread for lazy slicing.
+		self.prefetcher = None
+		# Storage type of lazy slices. May be 'full', 'packed' or 'rle'.
+		self.storage = 'full'
+		# Memory mapped file for lazy slices.
+		self.stackFile = None
+		# Recently unpacked slices for compact storage.
+		self.unpackedImages = collections.OrderedDict()
+		self.unpackedImagesMax = 8
 	
 	# Set size function.
 	def setSize(self, width, height):
@@ -1798,6 +1950,10 @@ class sliceStack(list):
 		self.height = height
 
 	def reset(self, width, height, numberOfSlices, imgType="noisy"):
+		# Leave lazy mode.
+		with self.lock:
+			self.pipeline = None
+		self.unpackedImages.clear()
 		# Set size of dummy image.
 		self.setSize(width, height)
 		self.createDummyImages()
@@ -1890,10 +2046,80 @@ class sliceStack(list):
 	def getImage(self,index):
 		# If index in bounds...
 		if int(index) < len(self):
+			index = int(index)
+			image = self.getSliceData(index)
+			# Unpack compact slices.
+			if isinstance(image, imageHandling.packedImage) or isinstance(image, imageHandling.runLengthImage):
+				image = self.unpackImage(index, image)
 			# ... return the image.
-			return self[int(index)]
+			return image
 		else:
 			return self.imageError
+	
+	
+	# Return a slice as it is stored. This may be an image, a packed
+	# image or a run length encoded image depending on the storage type.
+	def getSliceData(self, index):
+		index = int(index)
+		# In lazy mode, create the slice if it's not there yet
+		# and let the prefetcher continue from here.
+		if self.pipeline != None:
+			image = self.sliceLazy(index)
+			self.prefetcher.setFocus(index)
+			if image is None:
+				return self.imageError
+			return image
+		else:
+			return self[index]
+	
+	
+	# Unpack a compact slice. Keeps the last few unpacked slices.
+	def unpackImage(self, index, packedImage):
+		# Take the slice from the recently unpacked ones if it hasn't changed.
+		if index in self.unpackedImages and self.unpackedImages[index][0] is packedImage:
+			image = self.unpackedImages.pop(index)[1]
+		else:
+			image = packedImage.unpack()
+		# Add as most recently used and remove the least recently used.
+		self.unpackedImages[index] = (packedImage, image)
+		while len(self.unpackedImages) > self.unpackedImagesMax:
+			self.unpackedImages.popitem(last=False)
+		return image
+	
+	
+	# Switch to lazy mode. Slices will be created from the pipeline
+	# once they are requested. The pipeline input has to be set.
+	def setLazy(self, pipeline, prefetchLayers, storage='full', stackFile=None):
+		with self.lock:
+			self.pipeline = pipeline
+			self.storage = storage
+			self.stackFile = stackFile
+			self[:] = [None for i in range(pipeline.numberOfSlices)]
+		# Start prefetching from the first slice.
+		if self.prefetcher == None:
+			self.prefetcher = slicePrefetcher(self)
+			self.prefetcher.start()
+		self.prefetcher.prefetchLayers = prefetchLayers
+		self.prefetcher.setFocus(0)
+	
+	
+	# Create a slice in lazy mode if it's not there yet.
+	def sliceLazy(self, index, pipeline=None):
+		with self.lock:
+			# Don't slice if the stack has been reset in the meantime.
+			if self.pipeline == None or (pipeline != None and pipeline != self.pipeline):
+				return None
+			if self[index] is None:
+				self[index] = imageHandling.encodeImage(self.pipeline.sliceLayer(index), self.storage)
+				if self.stackFile != None:
+					self[index] = self.stackFile.write(index, self[index])
+			return self[index]
+	
+	
+	# Stop the prefetcher thread.
+	def stopPrefetcher(self):
+		if self.prefetcher != None:
+			self.prefetcher.stop()
 		
 			
 	# Function to add an image to a specific slice and at a specific position.
@@ -1911,24 +2137,293 @@ class sliceStack(list):
 
 
 ################################################################################
-# A thread to slice the model in background.	###################################
-################################################################################		
-class backgroundSlicer(threading.Thread):
-	def __init__(self, settings, programSettings, queueSlicerIn, queueSlicerOut, console=None):
+# Memory mapped slice stack file. ##############################################
+################################################################################
+# Holds the slices of a stack in one memory mapped scratch file so the
+# operating system can page them out instead of running out of memory.
+# Slices are stored as full images or packed to one bit per pixel.
+# The file is removed once it's closed and no slice uses it any more.
+class sliceStackFile:
+	def __init__(self, path, numberOfSlices, shape, storage='full'):
+		self.shape = tuple(shape)
+		self.storage = storage
+		# Create the scratch file.
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self.file = tempfile.NamedTemporaryFile(dir=path, suffix='.slices')
+		# Get the size of a single slice.
+		if self.storage == 'packed':
+			sliceShape = ((self.shape[0] * self.shape[1] + 7) / 8,)
+		else:
+			sliceShape = self.shape
+		self.slices = numpy.memmap(self.file, dtype=numpy.uint8, mode='w+', shape=(max(numberOfSlices, 1),) + sliceShape)
+	
+	# Write a slice to the file. Returns the slice
+	# in the storage type, backed by the file.
+	def write(self, index, image):
+		image = imageHandling.encodeImage(image, self.storage)
+		if self.storage == 'packed':
+			self.slices[index] = image.data
+			return imageHandling.packedImage(self.slices[index], image.shape)
+		else:
+			self.slices[index] = image
+			return self.slices[index]
+
+
+# Create a slice stack file if memory mapped slices are enabled in the
+# settings. Run length encoded slices can't be memory mapped as their
+# size varies, None is returned for these.
+def createSliceStackFile(programSettings, numberOfSlices, shape):
+	storage = programSettings['Slice storage'].value
+	if not programSettings['Memory mapped slices'].value or storage not in ['full', 'packed']:
+		return None
+	try:
+		return sliceStackFile(programSettings['Slice scratch path'].value, numberOfSlices, shape, storage)
+	except (IOError, OSError), error:
+		print "Could not create slice stack file: " + str(error) + ". Keeping slices in memory."
+		return None
+
+
+
+
+
+################################################################################
+# Prefetcher for lazy slice stacks. ############################################
+################################################################################
+# Creates the slices following the last requested one in the background
+# so they are ready when the print process or the slider gets there.
+class slicePrefetcher(threading.Thread):
+	def __init__(self, sliceStack, prefetchLayers=10):
 		# Internalise inputs.
-#		self.slicingFunction = slicingFunction
-		self.settings = settings
-		self.programSettings = programSettings
-		self.queueSlicerIn = queueSlicerIn
-		self.queueSlicerOut = queueSlicerOut
-		self.console = console
+		self.sliceStack = sliceStack
+		self.prefetchLayers = prefetchLayers
+		# Last requested slice.
+		self.focus = 0
+		# Event for focus changes.
+		self.focusChanged = threading.Event()
 		# Thread stop event.
 		self.stopThread = threading.Event()
 		# Call super class init function.
-		super(backgroundSlicer, self).__init__()
-		
-		# Set up slice stack as list.
-		self.sliceStack = []
+		super(slicePrefetcher, self).__init__()
+		# Don't keep the program alive.
+		self.daemon = True
+	
+	# Set the slice to prefetch from.
+	def setFocus(self, index):
+		self.focus = index
+		self.focusChanged.set()
+	
+	def stop(self):
+		self.stopThread.set()
+		self.focusChanged.set()
+	
+	# Overload the run method.
+	def run(self):
+		while not self.stopThread.isSet():
+			# Wait for the next request.
+			self.focusChanged.wait()
+			self.focusChanged.clear()
+			# Create the following slices until the focus changes.
+			pipeline = self.sliceStack.pipeline
+			focus = self.focus
+			for index in range(focus, min(focus + self.prefetchLayers + 1, len(self.sliceStack))):
+				if self.focusChanged.isSet() or self.stopThread.isSet() or pipeline == None:
+					break
+				self.sliceStack.sliceLazy(index, pipeline)
+
+
+
+
+
+################################################################################
+# Slice timer. #################################################################
+################################################################################
+# Records the time spent in each stage of the slicer per layer.
+# Stages that run several times for a layer, e.g. cutting model,
+# supports and bottom plate, are summed up.
+class sliceTimer:
+	stages = ['voxelize', 'cut', 'strip', 'extrude', 'stencil', 'convert', 'supports', 'masks', 'erode', 'fill', 'combine', 'distance']
+	
+	def __init__(self):
+		# Stage times in seconds by slice number.
+		self.layers = {}
+		# Layer that is being sliced.
+		self.layer = None
+	
+	
+	# Set the layer that following stage times belong to.
+	def setLayer(self, sliceNumber):
+		self.layer = sliceNumber
+	
+	# Add the time since start to a stage of the current layer.
+	# Returns the current time to start the next stage.
+	def stop(self, stage, start):
+		now = time.time()
+		self.add(stage, now - start)
+		return now
+	
+	# Add a stage time to the current or the given layer.
+	def add(self, stage, seconds, sliceNumber=None):
+		if sliceNumber == None:
+			sliceNumber = self.layer
+		layer = self.layers.setdefault(sliceNumber, {})
+		layer[stage] = layer.get(stage, 0) + seconds
+	
+	# Add stage times of another timer, e.g. from a slicer process.
+	def merge(self, layers):
+		for sliceNumber in layers:
+			for stage in layers[sliceNumber]:
+				self.add(stage, layers[sliceNumber][stage], sliceNumber)
+	
+	# Get the stage times and start over.
+	def pop(self):
+		layers = self.layers
+		self.reset()
+		return layers
+	
+	def reset(self):
+		self.layers = {}
+		self.layer = None
+	
+	
+	# Get total, mean and maximum time per layer for each stage.
+	def getSummary(self):
+		summary = {}
+		for stage in self.stages:
+			times = [self.layers[sliceNumber][stage] for sliceNumber in self.layers if stage in self.layers[sliceNumber]]
+			if len(times):
+				summary[stage] = {	'layers': len(times),
+								'total': sum(times),
+								'mean': sum(times) / len(times),
+								'max': max(times)	}
+		return summary
+	
+	# Get the summary as text lines, slowest stage first.
+	def getSummaryText(self):
+		summary = self.getSummary()
+		total = max(sum([summary[stage]['total'] for stage in summary]), 1e-9)
+		lines = ["Slicer stage times for " + str(len(self.layers)) + " layers:"]
+		for stage in sorted(summary, key=lambda stage: -summary[stage]['total']):
+			lines.append("   %-10s %8.3f s total, %7.2f ms mean, %7.2f ms max, %5.1f %%" % (stage, summary[stage]['total'], summary[stage]['mean']*1000, summary[stage]['max']*1000, summary[stage]['total']/total*100))
+		return lines
+	
+	# Write stage times per layer and the summary to a JSON file.
+	def save(self, filename):
+		with open(filename, 'w') as f:
+			json.dump({'layers': self.layers, 'summary': self.getSummary()}, f, indent=1, sort_keys=True)
+
+
+
+
+################################################################################
+# Support geometry. ############################################################
+################################################################################
+# Supports and bottom plate described by their dimensions instead of meshes.
+# Each support is a cylinder from the build platform up to a cone that
+# meets the model with the tip diameter at the tip z position. The cone
+# continues into the model until its radius is zero. The bottom plate is
+# an axis aligned box given by its bounds.
+# Cross sections are discs and rectangles that are drawn without cutting.
+class supportGeometry:
+	# Columns of the support table.
+	columns = ['x', 'y', 'tip z', 'base radius', 'tip radius', 'cone height']
+	
+	def __init__(self, supports=None, bottomPlate=None):
+		if supports is None:
+			supports = []
+		self.supports = numpy.array(supports, numpy.float64).reshape(-1, len(self.columns))
+		# Bottom plate bounds as (xMin, xMax, yMin, yMax, zMin, zMax).
+		self.bottomPlate = bottomPlate
+		# Heights where the cones end and start.
+		self.coneTop = self.supports[:,2] + self.supports[:,5] * self.supports[:,4] / self.supports[:,3]
+		self.coneBottom = self.coneTop - self.supports[:,5]
+	
+	
+	# Get the template meshes the supports are made of: a cone with
+	# its base of radius 1 at z = 0 and its tip at z = 1 and a cylinder
+	# of radius 1 from z = 0 to z = 1.
+	@staticmethod
+	def getTemplates(resolution=20):
+		return [meshHandling.coneMesh(resolution), meshHandling.cylinderMesh(resolution)]
+	
+	# Get the position, scale and template index of the cone and
+	# cylinder of each support. Cylinders are left out if the
+	# cone reaches down to the build platform.
+	def getGlyphs(self):
+		positions = numpy.zeros((len(self.supports), 3))
+		positions[:,:2] = self.supports[:,:2]
+		positions[:,2] = self.coneBottom
+		scales = numpy.repeat(self.supports[:,3:4], 3, axis=1)
+		scales[:,2] = self.supports[:,5]
+		cylinders = self.coneBottom > 0
+		positionsCylinders = positions[cylinders]
+		positionsCylinders[:,2] = 0
+		scalesCylinders = scales[cylinders]
+		scalesCylinders[:,2] = self.coneBottom[cylinders]
+		sources = numpy.repeat([0, 1], [len(positions), len(positionsCylinders)])
+		return numpy.vstack((positions, positionsCylinders)), numpy.vstack((scales, scalesCylinders)), sources
+	
+	# Get the mesh of all supports as points and triangles.
+	def getMesh(self, resolution=20):
+		positions, scales, sources = self.getGlyphs()
+		meshes = []
+		for index, (points, triangles) in enumerate(self.getTemplates(resolution)):
+			meshes.append(meshHandling.instanceMesh(points, triangles, scales[sources == index], positions[sources == index]))
+		return meshHandling.joinMeshes(meshes)
+	
+	
+	# Get centers and radii of the support cross sections at the given height.
+	def getDiscs(self, slicePosition):
+		cut = (self.coneTop >= slicePosition) & (slicePosition >= 0)
+		supports = self.supports[cut]
+		coneTop = self.coneTop[cut]
+		# Base radius in the cylinder, shrinking to zero at the cone top.
+		radii = numpy.minimum(supports[:,3], supports[:,3] * (coneTop - slicePosition) / supports[:,5])
+		return supports[:,:2], radii
+	
+	# Draw supports and bottom plate cross sections at the given height.
+	# Origin is the image position in mm, spacing the pixel size in mm.
+	def sliceSupportsAndBottomPlate(self, slicePosition, origin, spacing, width, height, image=None):
+		if image is None:
+			image = numpy.zeros((height, width), numpy.uint8)
+		centers, radii = self.getDiscs(slicePosition)
+		imageHandling.fillDiscs(image, centers, radii, origin, spacing)
+		if self.bottomPlate != None and self.bottomPlate[4] <= slicePosition <= self.bottomPlate[5]:
+			imageHandling.fillRectangle(image, self.bottomPlate[0:4:2], self.bottomPlate[1:4:2], origin, spacing)
+		return image
+	
+	
+	# Get a hash of the supports and bottom plate cut at each of the
+	# given slice positions like meshHandling.layerHashes does for meshes.
+	# Slice positions have to be sorted ascending.
+	def getLayerHashes(self, slicePositions):
+		values = [self.supports]
+		bottom = [numpy.zeros(len(self.supports))]
+		top = [self.coneTop]
+		if self.bottomPlate != None:
+			values.append(numpy.array([self.bottomPlate], numpy.float64))
+			bottom.append([self.bottomPlate[4]])
+			top.append([self.bottomPlate[5]])
+		itemHashes = meshHandling.hashRows(numpy.vstack(values))
+		first = numpy.searchsorted(slicePositions, numpy.hstack(bottom), side='right')
+		last = numpy.searchsorted(slicePositions, numpy.hstack(top), side='right')
+		return meshHandling.sumRangeHashes(itemHashes, first, last, len(slicePositions))
+
+
+
+
+################################################################################
+# VTK slicing engine. ##########################################################
+################################################################################
+# Cuts, extrudes and stencils model, supports and bottom plate
+# to create the slice images for a given height.
+class sliceEngineVtk:
+	def __init__(self, programSettings, timer=None):
+		# Internalise inputs.
+		self.programSettings = programSettings
+		if timer == None:
+			timer = sliceTimer()
+		self.timer = timer
 		
 		# Create VTK error observer to catch errors.
 		self.errorObserver = ErrorObserver()
@@ -2015,285 +2510,1024 @@ class backgroundSlicer(threading.Thread):
 		self.stencilBottomPlate.SetStencil(self.extruderStencilBottomPlate.GetOutput())
 		self.stencilBottomPlate.ReverseStencilOff()
 		self.stencilBottomPlate.SetBackgroundValue(0.0)
+		# Combined stencil for supports and bottom plate.
+		# Supports are clipped at the bottom plate top so that the
+		# even-odd stencil does not cut holes where they overlap.
+		self.clipPlane = vtk.vtkPlane()
+		self.clipPlane.SetNormal(0,0,1)
+		self.clipFilterSupports = vtk.vtkClipPolyData()
+		self.clipFilterSupports.SetClipFunction(self.clipPlane)
+		self.appendSupportsBottomPlate = vtk.vtkAppendPolyData()
+	
+	
+	# Set input polydata and image geometry.
+	def setInput(self, inputModel, positionMm, width, height, spacing):
+		self.width = width
+		self.height = height
+		# Get triangle index of the model if there is one.
+		# The cutter will only get the triangles around the slice plane then.
+		if len(inputModel) > 3 and inputModel[3] != None:
+			self.indexModel = inputModel[3]
+		else:
+			self.indexModel = None
+		# Set inputs.
+		self.cuttingFilterModel.SetInput(inputModel[0])
+		self.cuttingFilterModel.Update()
+		self.cuttingFilterBottomPlate.SetInput(inputModel[2])
+		# Append supports and bottom plate once per job if
+		# they should be sliced in a single pass.
+		self.combinedStencil = self.programSettings['Combined stencil'].value
+		if self.combinedStencil:
+			bounds = [0 for i in range(6)]
+			inputModel[2].GetBounds(bounds)
+			self.clipPlane.SetOrigin(0,0,bounds[5])
+			self.clipFilterSupports.SetInput(inputModel[1])
+			self.appendSupportsBottomPlate.RemoveAllInputs()
+			self.appendSupportsBottomPlate.AddInput(self.clipFilterSupports.GetOutput())
+			self.appendSupportsBottomPlate.AddInput(inputModel[2])
+			self.appendSupportsBottomPlate.Update()
+			self.cuttingFilterSupports.SetInput(self.appendSupportsBottomPlate.GetOutput())
+		else:
+			self.cuttingFilterSupports.SetInput(inputModel[1])
+		
+		# Prepare vtk image and extruder stencils.
+		imageWhite = numpy.ones((height, width), numpy.uint8) * 255
+		self.image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(imageWhite))
+		self.image.SetOrigin(positionMm[0], positionMm[1], 0)	# mm
+		self.image.SetDimensions(width, height, 1)
+		self.image.SetSpacing(spacing)
+		self.image.AllocateScalars()
+		
+		# Set new position for extruder stencils.
+		# Model.
+		self.extruderStencilModel.SetOutputOrigin(positionMm)
+		self.extruderStencilModel.SetOutputWholeExtent(self.image.GetExtent())
+		self.extruderStencilModel.SetOutputSpacing(spacing)
+		# Supports.
+		self.extruderStencilSupports.SetOutputOrigin(positionMm)
+		self.extruderStencilSupports.SetOutputWholeExtent(self.image.GetExtent())
+		self.extruderStencilSupports.SetOutputSpacing(spacing)
+		# Bottom plate.
+		self.extruderStencilBottomPlate.SetOutputOrigin(positionMm)
+		self.extruderStencilBottomPlate.SetOutputWholeExtent(self.image.GetExtent())
+		self.extruderStencilBottomPlate.SetOutputSpacing(spacing)
+	
+	
+	# Get model slice image at given height.
+	def sliceModel(self, slicePosition):
+		interval = time.time()
+		# Only cut the triangles around the slice plane if indexed.
+		if self.indexModel != None:
+			self.cuttingFilterModel.SetInput(meshHandling.trianglesToPolydata(self.indexModel.points, self.indexModel.getTriangles(slicePosition)))
+		self.timer.stop('cut', interval)
+		return self.__updateStencil(self.cuttingFilterModel, self.sectionStripperModel, self.extruderModel, self.stencilModel, slicePosition)
+	
+	# Get combined supports and bottom plate slice image at given height.
+	def sliceSupportsAndBottomPlate(self, slicePosition):
+		# Single stencil pass for the appended geometry.
+		if self.combinedStencil:
+			return self.__updateStencil(self.cuttingFilterSupports, self.sectionStripperSupports, self.extruderSupports, self.stencilSupports, slicePosition)
+		# Separate passes otherwise.
+		else:
+			imageSupports = self.__updateStencil(self.cuttingFilterSupports, self.sectionStripperSupports, self.extruderSupports, self.stencilSupports, slicePosition)
+			imageBottomPlate = self.__updateStencil(self.cuttingFilterBottomPlate, self.sectionStripperBottomPlate, self.extruderBottomPlate, self.stencilBottomPlate, slicePosition)
+			interval = time.time()
+			image = cv2.add(imageSupports, imageBottomPlate)
+			self.timer.stop('combine', interval)
+			return image
+	
+	
+	# Set new height for the cutting plane and extruder, update the
+	# stencil and return its image as numpy array.
+	# The filters are updated one by one to time each stage.
+	def __updateStencil(self, cutter, stripper, extruder, stencil, slicePosition):
+		interval = time.time()
+		self.cuttingPlane.SetOrigin(0,0,slicePosition)
+		extruder.SetVector(0,0,-slicePosition-1)
+		# Update the pipeline.
+		cutter.Update()
+		interval = self.timer.stop('cut', interval)
+		stripper.Update()
+		interval = self.timer.stop('strip', interval)
+		extruder.Update()
+		interval = self.timer.stop('extrude', interval)
+		stencil.Update()
+		interval = self.timer.stop('stencil', interval)
+		if self.programSettings['showVtkErrors'].value and self.errorObserver.ErrorOccurred():
+			print "VTK Error: " + self.errorObserver.ErrorMessage()
+		# Get pixel values from vtk image data and turn into numpy array.
+		image = numpy_support.vtk_to_numpy(stencil.GetOutput().GetPointData().GetScalars())
+		# Now we have the pixel values in a long list. Transform them into a 2d array.
+		image = image.reshape(1, self.height, self.width)
+		image = image.transpose(1,2,0)
+		# Remove 3rd dimension.
+		image = numpy.squeeze(image)
+		# Cast to uint8.
+		image = numpy.uint8(image)
+		self.timer.stop('convert', interval)
+		return image
+
+
+
+
+################################################################################
+# Numpy slicing engine. ########################################################
+################################################################################
+# Intersects the triangles of model, supports and bottom plate that are
+# cut by the slice plane in one vectorised pass, joins the segments into contours
+# and fills them using even-odd filling. Creates the same images as the
+# VTK engine.
+class sliceEngineNumpy:
+	def __init__(self, programSettings, timer=None):
+		# Internalise inputs.
+		self.programSettings = programSettings
+		if timer == None:
+			timer = sliceTimer()
+		self.timer = timer
+	
+	
+	# Set input polydata and image geometry.
+	def setInput(self, inputModel, positionMm, width, height, spacing):
+		self.positionMm = positionMm
+		self.width = width
+		self.height = height
+		self.spacing = spacing[0]
+		# Get triangle index of the model or create it if there is none.
+		if len(inputModel) > 3 and inputModel[3] != None:
+			self.indexModel = inputModel[3]
+		else:
+			self.indexModel = meshHandling.triangleIndex(*meshHandling.polydataToTriangles(inputModel[0]))
+		# Create triangle indices for supports and bottom plate.
+		self.indexSupports = meshHandling.triangleIndex(*meshHandling.polydataToTriangles(inputModel[1]))
+		self.indexBottomPlate = meshHandling.triangleIndex(*meshHandling.polydataToTriangles(inputModel[2]))
+	
+	
+	# Get model slice image at given height.
+	def sliceModel(self, slicePosition):
+		return self.__sliceMesh(self.indexModel, slicePosition)
+	
+	# Get combined supports and bottom plate slice image at given height.
+	# Both are filled into the same image, so there is no need to add them.
+	def sliceSupportsAndBottomPlate(self, slicePosition):
+		image = self.__sliceMesh(self.indexSupports, slicePosition)
+		return self.__sliceMesh(self.indexBottomPlate, slicePosition, image)
+	
+	
+	def __sliceMesh(self, index, slicePosition, image=None):
+		interval = time.time()
+		contours = meshHandling.sliceIndex(index, slicePosition)
+		interval = self.timer.stop('cut', interval)
+		image = meshHandling.fillContours(contours, self.positionMm, self.spacing, self.width, self.height, image)
+		self.timer.stop('stencil', interval)
+		return image
+
+
+
+
+################################################################################
+# Voxel slicing engine. ########################################################
+################################################################################
+# Intersects vertical rays through all pixels with the meshes once and
+# keeps the intervals along each ray that are inside. Slice images are
+# created by testing the intervals against the slice height, so the
+# meshes are not cut for every layer. The rays are cast on the first
+# slice request, so only the meshes that are actually sliced are voxelized.
+class sliceEngineVoxel:
+	def __init__(self, programSettings, timer=None):
+		# Internalise inputs.
+		self.programSettings = programSettings
+		if timer == None:
+			timer = sliceTimer()
+		self.timer = timer
+	
+	
+	# Set input polydata and image geometry.
+	def setInput(self, inputModel, positionMm, width, height, spacing):
+		self.positionMm = positionMm
+		self.width = width
+		self.height = height
+		self.spacing = spacing[0]
+		self.inputModel = inputModel
+		# Ray intervals of the model and of supports and bottom plate.
+		self.columnsModel = None
+		self.columnsSupports = None
+	
+	
+	# Get model slice image at given height.
+	def sliceModel(self, slicePosition):
+		if self.columnsModel == None:
+			# Use the points and triangles of the model index if there is one.
+			if len(self.inputModel) > 3 and self.inputModel[3] != None:
+				self.columnsModel = self.__voxelize(self.inputModel[3].points, self.inputModel[3].triangles)
+			else:
+				self.columnsModel = self.__voxelize(*meshHandling.polydataToTriangles(self.inputModel[0]))
+		interval = time.time()
+		image = self.columnsModel.getSlice(slicePosition)
+		self.timer.stop('stencil', interval)
+		return image
+	
+	# Get combined supports and bottom plate slice image at given height.
+	# Supports and bottom plate are voxelized separately as the even-odd
+	# rule would cut holes where they overlap.
+	def sliceSupportsAndBottomPlate(self, slicePosition):
+		if self.columnsSupports == None:
+			self.columnsSupports = [self.__voxelize(*meshHandling.polydataToTriangles(polydata)) for polydata in self.inputModel[1:3]]
+		interval = time.time()
+		image = None
+		for columns in self.columnsSupports:
+			image = columns.getSlice(slicePosition, image)
+		self.timer.stop('stencil', interval)
+		return image
+	
+	
+	def __voxelize(self, points, triangles):
+		interval = time.time()
+		columns = meshHandling.columnIntervals(points, triangles, self.positionMm, self.spacing, self.width, self.height)
+		self.timer.stop('voxelize', interval)
+		return columns
+
 
+
+
+################################################################################
+# Slicer pipeline. #############################################################
+################################################################################
+# Creates the slice image for a single layer from the images of the slicing
+# engine. Adds hollowing and fill pattern and combines model, supports and
+# bottom plate. Used by the background slicer thread and by the worker
+# processes of the parallel slicer which build their own pipeline each.
+class slicePipeline:
+	def __init__(self, settings, programSettings, console=None):
+		# Internalise inputs.
+		self.settings = settings
+		self.programSettings = programSettings
+		self.console = console
 		
-	# Overload the run method.
-	# This will automatically run once the init function is done.	
-	def run(self):
-		if self.console:
-			self.console.addLine("Slicer thread initialised")
-		# Go straight into idle mode.
-		self.idle()
+		# Stage times of the slicer.
+		self.timer = sliceTimer()
 		
-	# Check for input models in the queue.
-	def newInputInQueue(self):
-		if self.queueSlicerIn.qsize():
-			return True
+		# Create the slicing engine.
+		self.engineName = None
+		self.updateEngine()
+	
+	
+	# Create the slicing engine from the settings if it has changed.
+	def updateEngine(self):
+		if self.engineName == self.programSettings['Slicing engine'].value:
+			return
+		self.engineName = self.programSettings['Slicing engine'].value
+		if self.engineName == 'numpy':
+			self.engine = sliceEngineNumpy(self.programSettings, self.timer)
+		elif self.engineName == 'voxel':
+			self.engine = sliceEngineVoxel(self.programSettings, self.timer)
 		else:
-			return False
+			self.engine = sliceEngineVtk(self.programSettings, self.timer)
 	
-	# Continuously check queue for start signals.
-	def idle(self):
-		# Do nothing as long as nothing is in the queue.
-		while not self.newInputInQueue() and not self.stopThread.isSet():
-			time.sleep(0.1)
-		# If input has arrived get the input run slicer function.
-		if not self.stopThread.isSet():
-			newInput = self.queueSlicerIn.get()
-			self.runSlicer(newInput)
+	
+	# Set input polydata and calc slice stack parameters.
+	# The slicing engine is changed if the settings ask for another one.
+	def setInput(self, inputModel):
+		self.updateEngine()
+		# Calc slice stack parameters.
+		# Get size of the model in mm.
+		self.bounds = [0 for i in range(6)]
+		inputModel[0].GetBounds(self.bounds)
+		# Get layer height in mm.
+		self.layerHeight = 	self.programSettings['Layer height'].value
+		# Calc number of layers.
+		self.numberOfSlices = int(math.ceil(self.bounds[5] / self.layerHeight))
+		# Get rim size in pixels.
+		rim = int(self.programSettings['Model safety distance'].value * self.programSettings['pxPerMm'].value)
+		# Get position in pixels. Include rim.
+		self.position = (int(self.bounds[0]*self.programSettings['pxPerMm'].value-rim), int(self.bounds[2]*self.programSettings['pxPerMm'].value-rim), 0)
+		self.positionMm = (self.bounds[0]-rim/self.programSettings['pxPerMm'].value, self.bounds[2]-rim/self.programSettings['pxPerMm'].value, 0)
+		# Get size in pixels. Add rim twice.
+		self.width = int(math.ceil((self.bounds[1]-self.bounds[0]) * self.programSettings['pxPerMm'].value) + rim*2)
+		self.height = int(math.ceil((self.bounds[3]-self.bounds[2]) * self.programSettings['pxPerMm'].value) + rim*2)
+		# Get pixel spacing from settings.
+		spacing = (1./self.programSettings['pxPerMm'].value,)*3
+		# Prepare images.
+		self.imageBlack = numpy.zeros((self.height, self.width), numpy.uint8)
+		self.imageFill = self.createFillPattern(self.width, self.height)
+		# Position and size of the sliced area in the whole image
+		# as (x, y, width, height) for the fill pattern.
+		self.fillFrame = (0, 0, self.width, self.height)
+		# Part of the sliced area that is returned. None returns all of it.
+		self.tileCrop = None
+		# Set engine inputs.
+		self.engine.setInput(inputModel, self.positionMm, self.width, self.height, spacing)
+		self.inputModel = inputModel
+		# Draw supports and bottom plate from their dimensions
+		# instead of slicing their meshes if possible.
+		if self.programSettings['Analytic supports'].value and len(inputModel) > 4 and inputModel[4] != None:
+			self.supportGeometry = inputModel[4]
+		else:
+			self.supportGeometry = None
+		# Get number of layers that make up the shell wall thickness.
+		self.wallLayers = max(1, int(round(self.settings['Shell wall thickness'].value / self.layerHeight)))
+		# Rolling window of model slices for the hollowing masks.
+		# Holds the slices one wall thickness above and below the
+		# current layer and the layer itself.
+		self.modelSlices = collections.OrderedDict()
+		self.modelSlicesMax = 2 * self.wallLayers + 2
+		# Hollow the whole stack in 3D after slicing instead of
+		# hollowing each layer in 2D. Done by the background slicer.
+		self.volumeHollowing = self.settings['Print hollow'].value == True and self.programSettings['Hollowing method'].value == 'distance'
+		# Model slices of the sliced layers for 3D hollowing, so
+		# the slicer does not have to cut the model again.
+		self.volumeModelSlices = {}
+	
+	
+	# Split the image into tiles of the size given in the settings.
+	# Tiles are given as (xMin, yMin, xMax, yMax) in pixels.
+	# Returns a single None tile if the image does not need to be split.
+	def getTiles(self):
+		tileSize = int(self.programSettings['Slice tile size'].value)
+		if tileSize <= 0 or (self.width <= tileSize and self.height <= tileSize):
+			return [None]
+		return [(x, y, min(x + tileSize, self.width), min(y + tileSize, self.height)) for y in range(0, self.height, tileSize) for x in range(0, self.width, tileSize)]
+	
+	# Only slice a tile of the image. The sliced area overlaps
+	# the tile by one shell wall thickness so the erosion for hollowing
+	# is the same as for the whole image. Slices are cropped to the tile.
+	# Call after setInput.
+	def setTile(self, tile):
+		overlap = int(math.ceil(self.settings['Shell wall thickness'].value * self.programSettings['pxPerMm'].value)) + 1
+		xMin = max(0, tile[0] - overlap)
+		yMin = max(0, tile[1] - overlap)
+		xMax = min(self.width, tile[2] + overlap)
+		yMax = min(self.height, tile[3] + overlap)
+		self.tileCrop = (slice(tile[1] - yMin, tile[3] - yMin), slice(tile[0] - xMin, tile[2] - xMin))
+		self.fillFrame = (xMin, yMin, self.width, self.height)
+		# Move the image to the sliced area.
+		spacing = (1./self.programSettings['pxPerMm'].value,)*3
+		self.position = (self.position[0] + xMin, self.position[1] + yMin, 0)
+		self.positionMm = (self.positionMm[0] + xMin * spacing[0], self.positionMm[1] + yMin * spacing[1], 0)
+		self.width = xMax - xMin
+		self.height = yMax - yMin
+		self.imageBlack = numpy.zeros((self.height, self.width), numpy.uint8)
+		self.modelSlices.clear()
+		self.volumeModelSlices.clear()
+		self.engine.setInput(self.inputModel, self.positionMm, self.width, self.height, spacing)
+	
+	
+	# Get a fingerprint of the inputs of each layer.
+	# Layers with unchanged fingerprint will result in the same image.
+	# Consists of the model geometry, the supports and bottom plate
+	# triangles cut at the layer's height and the settings for image size,
+	# hollowing and fill pattern.
+	def getLayerFingerprints(self):
+		# Hash the inputs that are common to all layers.
+		fingerprint = hashlib.sha1()
+		if len(self.inputModel) > 3 and self.inputModel[3] != None:
+			points, triangles = self.inputModel[3].points, self.inputModel[3].triangles
+		else:
+			points, triangles = meshHandling.polydataToTriangles(self.inputModel[0])
+		fingerprint.update(numpy.ascontiguousarray(points).tostring())
+		fingerprint.update(numpy.ascontiguousarray(triangles).tostring())
+		fingerprint.update(repr((	self.positionMm,
+									self.width,
+									self.height,
+									self.programSettings['pxPerMm'].value,
+									self.programSettings['Slicing engine'].value,
+									self.programSettings['Combined stencil'].value,
+									self.layerHeight,
+									self.settings['Print hollow'].value,
+									self.programSettings['Hollowing method'].value,
+									self.supportGeometry != None,
+									self.settings['Fill'].value,
+									self.settings['Shell wall thickness'].value,
+									self.settings['Fill spacing'].value,
+									self.settings['Fill wall thickness'].value	)))
+		# Hash supports and bottom plate for each layer.
+		slicePositions = numpy.arange(self.numberOfSlices) * self.layerHeight
+		slicePositions[0] = 0.001
+		if self.supportGeometry != None:
+			hashes = [self.supportGeometry.getLayerHashes(slicePositions)]
+		else:
+			hashes = [	meshHandling.layerHashes(*(meshHandling.polydataToTriangles(self.inputModel[1]) + (slicePositions,))),
+						meshHandling.layerHashes(*(meshHandling.polydataToTriangles(self.inputModel[2]) + (slicePositions,)))	]
+		# Combine.
+		fingerprints = []
+		for sliceNumber in range(self.numberOfSlices):
+			layerFingerprint = fingerprint.copy()
+			layerFingerprint.update(repr(sliceNumber))
+			for layerHashes in hashes:
+				layerFingerprint.update(layerHashes[sliceNumber].tostring())
+			fingerprints.append(layerFingerprint.digest())
+		return fingerprints
+	
+	
+	# Create the slice image for the given layer.
+	def sliceLayer(self, sliceNumber):
+		layerHeight = self.layerHeight
+		slicePosition = self.getSlicePosition(sliceNumber)
+		self.timer.setLayer(sliceNumber)
+
+		# Get slice images from the engine.
+		# Take the model slice from the rolling window if hollowing in 2D.
+		if self.settings['Print hollow'].value == True and not self.volumeHollowing:
+			self.imageModel = self.getModelSlice(sliceNumber)
+		else:
+			self.imageModel = self.engine.sliceModel(slicePosition)
+			# Keep the model slice for 3D hollowing.
+			if self.volumeHollowing:
+				self.volumeModelSlices[sliceNumber] = self.imageModel if self.tileCrop == None else self.imageModel[self.tileCrop]
+		if self.supportGeometry != None:
+			interval = time.time()
+			self.imageSupports = self.supportGeometry.sliceSupportsAndBottomPlate(slicePosition, self.positionMm, 1./self.programSettings['pxPerMm'].value, self.width, self.height)
+			self.timer.stop('supports', interval)
+		else:
+			self.imageSupports = self.engine.sliceSupportsAndBottomPlate(slicePosition)
+
+		# Create fill pattern. #####################################
+		# Get pixel values from 10 slices above and below.
+		# We need to analyse these to be able to generate closed bottom and top surfaces.
+		# Only use model slice data. Supports and bottom plate have no internal pattern anyway.
+		# Check if we are in the first or last mm of the model, then there should not be a pattern anyways, so we set everything black.
+		# Only do this whole thing if fillFlag is set and fill is shown or print is going.
+		# Skip if the stack will be hollowed in 3D later on.
+		if self.settings['Print hollow'].value == True and not self.volumeHollowing:# and (self.programSettings['Show fill'].value == True or self.printFlag == True):
+			# Get wall thickness from settings.
+			wallThickness = self.settings['Shell wall thickness'].value	# [mm]
+			wallThicknessPx = wallThickness * self.programSettings['pxPerMm'].value
+		
+			# Get top and bottom masks for wall thickness.
+			# Only if we one wall thickness below top or above bottom.
+			if self.bounds[5] > layerHeight*sliceNumber+wallThickness and self.bounds[4] < layerHeight*sliceNumber-wallThickness:	
+				# The top mask is the AND of the model slices up to one
+				# wall thickness above, the bottom mask the AND of the
+				# model slices down to one wall thickness below.
+				# The slices come from the rolling window, so the
+				# mesh does not have to be cut again.
+				imagesTop = [self.getModelSlice(sliceNumber+i) for i in range(1, self.wallLayers+1)]
+				imagesBottom = [self.getModelSlice(sliceNumber-i) for i in range(1, self.wallLayers+1)]
+				interval = time.time()
+				self.imageTopMask = imagesTop[0]
+				self.imageBottomMask = imagesBottom[0]
+				for i in range(1, self.wallLayers):
+					self.imageTopMask = cv2.bitwise_and(self.imageTopMask, imagesTop[i])
+					self.imageBottomMask = cv2.bitwise_and(self.imageBottomMask, imagesBottom[i])
+				self.timer.stop('masks', interval)
+		
+			# If cutting plane is inside top or bottom wall...
+			else:
+				# ... set masks black.
+				self.imageTopMask = self.imageBlack
+				self.imageBottomMask = self.imageBlack
 
+
+			# Erode model image to create wall thickness.
+			interval = time.time()
+			self.imageEroded = cv2.erode(self.imageModel, numpy.ones((wallThicknessPx,wallThicknessPx), numpy.uint8), iterations=1)
+			
+			# Multiply mask images with eroded image to prevent wall where mask images are black.
+			self.imageEroded = cv2.multiply(self.imageEroded, self.imageTopMask)
+			self.imageEroded = cv2.multiply(self.imageEroded, self.imageBottomMask)
+			interval = self.timer.stop('erode', interval)
+
+			# Add internal pattern to wall. Write result to original slice image.
+			if self.settings['Fill'].value == True:
 		
-	def runSlicer(self, inputModel):
-		# Don't run if stop condition is set.
+				# Mask internal pattern using the eroded image.
+				self.imageEroded = cv2.multiply(self.imageEroded, self.getFillPattern(sliceNumber))
+				interval = self.timer.stop('fill', interval)
+
+			# Subtract cavity with our without fill pattern from model.
+			self.imageModel = cv2.subtract(self.imageModel, self.imageEroded)
+			self.timer.stop('erode', interval)
+			
+		# Combine model, supports and bottom plate images.
+		interval = time.time()
+		self.imageModel = cv2.add(self.imageModel, self.imageSupports)
+		self.timer.stop('combine', interval)
+		
+		# Crop the overlap if slicing a tile.
+		if self.tileCrop != None:
+			return self.imageModel[self.tileCrop]
+		
+		# Save image.
+#		im = Image.fromarray(self.imageModel)
+#		fileString = "sliceprint%03d.jpeg" % (sliceNumber,)
+#		im.save(fileString)
+		
+		return self.imageModel
+	
+	
+	# Get the fill pattern for a layer.
+	# Shift internal pattern 1 pixel per layer to prevent burning in the pdms coating.
+	# The shift is derived from the slice number so that layers
+	# can be sliced in any order, e.g. by the parallel slicer.
+	# The pattern is tiled twice in both directions, so the shifted
+	# pattern is a view into it and no copy is needed.
+	def getFillPattern(self, sliceNumber):
+		patternShift = sliceNumber + 1	# TODO: implement setting for pattern shift.
+		# Move to the sliced area if slicing a tile.
+		x, y, width, height = self.fillFrame
+		offsetY = -patternShift % height + y
+		offsetX = -patternShift % width + x
+		return self.imageFill[offsetY:offsetY+self.height, offsetX:offsetX+self.width]
+	
+	
+	# Get height of the slice plane for a layer.
+	def getSlicePosition(self, sliceNumber):
+		if sliceNumber == 0:
+			return 0.001
+		else:
+			return self.layerHeight*sliceNumber
+	
+	
+	# Take the model slice of a layer that was kept for 3D hollowing.
+	# Returns None if there is none.
+	def popVolumeModelSlice(self, sliceNumber):
+		return self.volumeModelSlices.pop(sliceNumber, None)
+	
+	
+	# Get a model slice from the rolling window or slice it if it's not in there.
+	# Layers are mostly sliced in ascending order, so each model slice
+	# is cut only once.
+	def getModelSlice(self, sliceNumber):
+		if sliceNumber in self.modelSlices:
+			image = self.modelSlices.pop(sliceNumber)
+		else:
+			image = self.engine.sliceModel(self.getSlicePosition(sliceNumber))
+		self.modelSlices[sliceNumber] = image
+		# Remove least recently used slices.
+		while len(self.modelSlices) > self.modelSlicesMax:
+			self.modelSlices.popitem(last=False)
+		return image
+	
+	
+	# Create an opencv image with rectangular pattern for filling large model areas.
+	# Returns the pattern tiled twice in both directions for shifting.
+	def createFillPattern(self, width, height):
+		spacing = self.settings['Fill spacing'].value * self.programSettings['pxPerMm'].value
+		wallThickness = self.settings['Fill wall thickness'].value * self.programSettings['pxPerMm'].value
+		return imageHandling.createFillPattern(width, height, spacing, wallThickness)
+
+
+
+
+################################################################################
+# Helpers for the parallel slicer. #############################################
+################################################################################
+# VTK objects cannot be pickled, so the input polydata is handed to the
+# worker processes as point and triangle arrays. Settings objects carry a
+# reference to the gui console, so only their values are passed on.
+
+# Get the meshes of model, supports and bottom plate.
+# The model mesh is taken from its triangle index if there is one.
+def getInputMeshes(inputModel):
+	if len(inputModel) > 3 and inputModel[3] != None:
+		meshes = [(inputModel[3].points, inputModel[3].triangles)]
+	else:
+		meshes = [meshHandling.polydataToTriangles(inputModel[0])]
+	return meshes + [meshHandling.polydataToTriangles(polydata) for polydata in inputModel[1:3]]
+
+# Get a dictionary of setting values from a settings object.
+def getSettingsValues(settings):
+	values = {}
+	for key in settings:
+		values[key] = settings[key].value
+	return values
+
+# Write a dictionary of setting values to a settings object.
+def setSettingsValues(settings, values):
+	for key in values:
+		if key in settings:
+			settings[key].value = values[key]
+	return settings
+
+# Slicer job of the current worker process and its slice pipelines by tile.
+# The job is set once per process by the pool initialiser.
+workerJob = None
+workerPipelines = {}
+# Error of the pool initialiser. Reported for every chunk, as the pool
+# would restart workers forever if the initialiser raised it.
+workerError = None
+
+# Pool initialiser. Creates the worker's pipeline from the slicer job.
+# Pipelines for tiles are created once their first chunk comes in.
+def initSlicerWorker(settingsValues, programSettingsValues, inputMeshes, indexModel, supportGeometry=None):
+	global workerJob, workerError
+	try:
+		settings = setSettingsValues(monkeyprintSettings.modelSettings(), settingsValues)
+		programSettings = setSettingsValues(monkeyprintSettings.programSettings(), programSettingsValues)
+		workerJob = [settings, programSettings, [meshHandling.trianglesToPolydata(*mesh) for mesh in inputMeshes] + [indexModel, supportGeometry]]
+		workerPipelines.clear()
+		getWorkerPipeline(None)
+	except Exception, error:
+		workerError = error
+
+# Get the worker's pipeline for a tile. None is the whole image.
+def getWorkerPipeline(tile):
+	if tile not in workerPipelines:
+		settings, programSettings, inputModel = workerJob
+		pipeline = slicePipeline(settings, programSettings)
+		pipeline.setInput(inputModel)
+		if tile != None:
+			pipeline.setTile(tile)
+		workerPipelines[tile] = pipeline
+	return workerPipelines[tile]
+
+# Slice a chunk of layers given as list of slice numbers.
+# If a tile is given, only the tile is sliced.
+# Returns the slice numbers along with the images, stage times, tile and
+# the model slices for 3D hollowing. Errors are returned instead of the
+# images so the slicer thread gets an answer for every chunk.
+def sliceLayers(sliceNumbers, tile=None):
+	if workerError != None:
+		return [sliceNumbers, workerError, {}, tile, None]
+	sliceImages = []
+	modelImages = []
+	pipeline = workerPipelines[None]
+	try:
+		pipeline = getWorkerPipeline(tile)
+		for sliceNumber in sliceNumbers:
+			sliceImages.append(pipeline.sliceLayer(sliceNumber))
+			modelImages.append(pipeline.popVolumeModelSlice(sliceNumber))
+	except Exception, error:
+		return [sliceNumbers, error, pipeline.timer.pop(), tile, None]
+	return [sliceNumbers, sliceImages, pipeline.timer.pop(), tile, modelImages]
+
+
+
+
+################################################################################
+# A thread to slice the model in background.	###################################
+################################################################################		
+class backgroundSlicer(threading.Thread):
+	def __init__(self, settings, programSettings, queueSlicerIn, queueSlicerOut, console=None):
+		# Internalise inputs.
+#		self.slicingFunction = slicingFunction
+		self.settings = settings
+		self.programSettings = programSettings
+		self.queueSlicerIn = queueSlicerIn
+		self.queueSlicerOut = queueSlicerOut
+		self.console = console
+		# Thread stop event.
+		self.stopThread = threading.Event()
+		# Cancel token of the latest job.
+		self.cancelJob = threading.Event()
+		# Layer the user is looking at. Will be sliced first.
+		self.focus = 0
+		# Queue for the results of the slicer processes.
+		self.queueResults = Queue.Queue()
+		# Call super class init function.
+		super(backgroundSlicer, self).__init__()
+		
+		# Set up slice stack as list.
+		self.sliceStack = []
+		
+		# Slice images of the last run by layer fingerprint.
+		# Layers with unchanged inputs will be taken from here.
+		self.sliceCache = {}
+		
+		# Slice stacks of earlier runs on disk.
+		self.diskCache = monkeyprintSliceCache.diskSliceCache(self.programSettings, self.console)
+		
+		# Memory mapped file for the current job's slices.
+		self.stackFile = None
+		
+		# Model slices of the current job for 3D hollowing by layer.
+		self.volumeModelSlices = {}
+		
+		# Create the slicer pipeline.
+		self.pipeline = slicePipeline(self.settings, self.programSettings, self.console)
+
+		
+	# Overload the run method.
+	# This will automatically run once the init function is done.	
+	def run(self):
+		if self.console:
+			self.console.addLine("Slicer thread initialised")
+		# Wait for jobs and run them until the thread is stopped.
 		while not self.stopThread.isSet():
-			# Check if new input is in queue. If not...
-			if not self.newInputInQueue():
-				# ...do the slicing.
-				self.sliceStack = self.updateSlices(inputModel)
-			# If yes...
-			else:
-				# Break the loop, return to idle mode and restart from there.
+			job = self.queueSlicerIn.get()
+			# None is the stop signal.
+			if job == None:
+				break
+			inputModel, cacheKey, cancelJob = job
+			if not self.isCancelled(cancelJob):
+				self.runSlicer(inputModel, cacheKey, cancelJob)
+	
+	
+	# Cancel the running job and drop all jobs that have not
+	# been started yet.
+	def cancel(self):
+		self.cancelJob.set()
+		# Wake up the parallel slicer so it sees the cancel request.
+		self.queueResults.put(None)
+		# Drop waiting jobs.
+		while True:
+			try:
+				self.queueSlicerIn.get_nowait()
+			except Queue.Empty:
 				break
-			# Write the model to the output queue.
-			self.queueSlicerOut.put(self.sliceStack)
-			break
-		# Go back to idle mode.
-		self.idle()
+	
+	# Submit a new job. Cancels the running job.
+	# Slices will be taken from the disk cache if a cache key is given.
+	# Returns the cancel token that identifies the new job.
+	def submit(self, inputModel, cacheKey=None):
+		self.cancel()
+		self.cancelJob = threading.Event()
+		self.queueSlicerIn.put([inputModel, cacheKey, self.cancelJob])
+		return self.cancelJob
+	
+	# Check if the job has been cancelled or the thread has been stopped.
+	def isCancelled(self, cancelJob):
+		return cancelJob.isSet() or self.stopThread.isSet()
+	
+	# Set the layer the user is looking at.
+	def setFocus(self, sliceNumber):
+		self.focus = int(sliceNumber)
+	
+	
+	def runSlicer(self, inputModel, cacheKey, cancelJob):
+		self.pipeline.timer.reset()
+		# Try to load the slices from the disk cache.
+		sliceStack = self.diskCache.load(cacheKey)
+		if sliceStack != None:
+			# Slices come packed from the cache.
+			sliceStack = [imageHandling.encodeImage(image, self.programSettings['Slice storage'].value) for image in sliceStack]
+			# Move to memory mapped file if requested.
+			if len(sliceStack):
+				self.stackFile = createSliceStackFile(self.programSettings, len(sliceStack), sliceStack[0].shape)
+				if self.stackFile != None:
+					sliceStack = [self.stackFile.write(i, sliceStack[i]) for i in range(len(sliceStack))]
+			if self.console:
+				self.console.addLine("Slices loaded from cache.")
+			self.sliceStack = sliceStack
+			self.queueSlicerOut.put(['done', cancelJob, self.sliceStack, self.pipeline.timer.pop()])
+			# Fill the layer cache so later changes only re-slice the affected layers.
+			self.pipeline.setInput(inputModel)
+			fingerprints = self.pipeline.getLayerFingerprints()
+			if len(fingerprints) == len(sliceStack):
+				self.sliceCache = dict(zip(fingerprints, sliceStack))
+			return
+		# Do the slicing.
+		sliceStack = self.updateSlices(inputModel, cancelJob)
+		# Write the stack to the output queue if the job has not been cancelled.
+		if not self.isCancelled(cancelJob):
+			self.sliceStack = sliceStack
+			self.queueSlicerOut.put(['done', cancelJob, self.sliceStack, self.pipeline.timer.pop()])
+			# Save to the disk cache in another thread to be ready for the next job.
+			if cacheKey != None:
+				saveThread = threading.Thread(target=self.diskCache.save, args=(cacheKey, self.sliceStack))
+				saveThread.daemon = True
+				saveThread.start()
+		elif self.console:
+			self.console.addLine("Restarting slicer.")
 	
 	def stop(self):
 		if self.console != None:
 			self.console.addLine("Stopping slicer thread")
 		self.stopThread.set()
+		self.cancelJob.set()
+		self.queueResults.put(None)
+		self.queueSlicerIn.put(None)
 	
 	def join(self, timeout=None):
-		if self.console != None:
-			self.console.addLine("Stopping slicer thread")
-		self.stopThread.set()
+		self.stop()
 		threading.Thread.join(self, timeout)
 	
 	
+	# Get the order in which to slice the given layers.
+	# The focus layer comes first, then its neighbours
+	# and then the remaining layers from the bottom up.
+	def getSliceOrder(self, sliceNumbers, focus):
+		priorityLayers = self.programSettings['Priority layers'].value
+		def priority(sliceNumber):
+			distance = abs(sliceNumber - focus)
+			if distance <= priorityLayers:
+				return (0, distance, sliceNumber)
+			else:
+				return (1, 0, sliceNumber)
+		return sorted(sliceNumbers, key=priority)
+	
+	
 	# Update slice stack.
-	def updateSlices(self, inputModel):
-		if not self.stopThread.isSet():
-			# Reset slice stack.
-			self.sliceStack = []
-			
-			# Set inputs.
-			self.cuttingFilterModel.SetInput(inputModel[0])
-			self.cuttingFilterModel.Update()
-			self.cuttingFilterSupports.SetInput(inputModel[1])
-			self.cuttingFilterBottomPlate.SetInput(inputModel[2])
-			
-			# Calc slice stack parameters.
-			# Get size of the model in mm.
-			bounds = [0 for i in range(6)]
-			inputModel[0].GetBounds(bounds)
-			print "Model bounds: " + str(bounds) + "."
-			# Get layer height in mm.
-			layerHeight = 	self.programSettings['Layer height'].value
-			# Calc number of layers.
-			numberOfSlices = int(math.ceil(bounds[5] / layerHeight))
-			# Get rim size in pixels.
-			rim = int(self.programSettings['Model safety distance'].value * self.programSettings['pxPerMm'].value)
-			# Get position in pixels. Include rim.
-			position = (int(bounds[0]*self.programSettings['pxPerMm'].value-rim), int(bounds[2]*self.programSettings['pxPerMm'].value-rim), 0)
-			positionMm = (bounds[0]-rim/self.programSettings['pxPerMm'].value, bounds[2]-rim/self.programSettings['pxPerMm'].value, 0)
-			# Get size in pixels. Add rim twice.
-			width = int(math.ceil((bounds[1]-bounds[0]) * self.programSettings['pxPerMm'].value) + rim*2)
-			height = int(math.ceil((bounds[3]-bounds[2]) * self.programSettings['pxPerMm'].value) + rim*2)
-			print "Width and height: " + str((width, height)) + "."
-			# Get pixel spacing from settings.
-			spacing = (1./self.programSettings['pxPerMm'].value,)*3
-			# Prepare images.
-			self.imageWhite = numpy.ones((height, width), numpy.uint8)
-			self.imageWhite *= 255.
-			self.imageBlack = numpy.zeros((height, width), numpy.uint8)
-			self.imageFill = self.createFillPattern(width, height)
-
-			# Prepare vtk image and extruder stencils.
-			self.image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(self.imageWhite))
-			self.image.SetOrigin(positionMm[0], positionMm[1], 0)	# mm
-			self.image.SetDimensions(width, height, 1)
-			self.image.SetSpacing(spacing)
-			self.image.AllocateScalars()
-			
-			# Set new position for extruder stencils.
-			# Model.
-			self.extruderStencilModel.SetOutputOrigin(positionMm)
-			self.extruderStencilModel.SetOutputWholeExtent(self.image.GetExtent())
-			self.extruderStencilModel.SetOutputSpacing(spacing)
-			# Supports.
-			self.extruderStencilSupports.SetOutputOrigin(positionMm)
-			self.extruderStencilSupports.SetOutputWholeExtent(self.image.GetExtent())
-			self.extruderStencilSupports.SetOutputSpacing(spacing)
-			# Bottom plate.
-			self.extruderStencilBottomPlate.SetOutputOrigin(positionMm)
-			self.extruderStencilBottomPlate.SetOutputWholeExtent(self.image.GetExtent())
-			self.extruderStencilBottomPlate.SetOutputSpacing(spacing)
-			
-
-			# Loop through slices.
-			for sliceNumber in range(numberOfSlices):
-				# Make breakable by new input or termination request.
-				if not self.newInputInQueue() and not self.stopThread.isSet():
-					# Sleep for a very short period to allow GUI thread some CPU usage.
-					time.sleep(0.01)
-					# Set new height for the cutting plane and extruders.
-					if sliceNumber == 0:
-						slicePosition = 0.001
-					else:
-						slicePosition = layerHeight*sliceNumber
-					self.cuttingPlane.SetOrigin(0,0,slicePosition)
-					self.extruderModel.SetVector(0,0,-slicePosition-1)
-					self.extruderSupports.SetVector(0,0,-slicePosition-1)
-					self.extruderBottomPlate.SetVector(0,0,-slicePosition-1)
-			
-					# Update the pipeline.
-					self.stencilModel.Update()
-					if self.programSettings['showVtkErrors'].value and self.errorObserver.ErrorOccurred():
-						print "VTK Error: " + self.errorObserver.ErrorMessage()
-					self.stencilSupports.Update()
-					if self.programSettings['showVtkErrors'].value and self.errorObserver.ErrorOccurred():
-						print "VTK Error: " + self.errorObserver.ErrorMessage()
-					self.stencilBottomPlate.Update()
-					if self.programSettings['showVtkErrors'].value and self.errorObserver.ErrorOccurred():
-						print "VTK Error: " + self.errorObserver.ErrorMessage()
-		
-					# Get pixel values from vtk image data and turn into numpy array.
-					self.imageModel = numpy_support.vtk_to_numpy(self.stencilModel.GetOutput().GetPointData().GetScalars())
-					self.imageSupports = numpy_support.vtk_to_numpy(self.stencilSupports.GetOutput().GetPointData().GetScalars())
-					self.imageBottomPlate = numpy_support.vtk_to_numpy(self.stencilBottomPlate.GetOutput().GetPointData().GetScalars())
-					# Now we have the pixel values in a long list. Transform them into a 2d array.
-					self.imageModel = self.imageModel.reshape(1, height, width)
-					self.imageModel = self.imageModel.transpose(1,2,0)
-					self.imageSupports = self.imageSupports.reshape(1, height, width)
-					self.imageSupports = self.imageSupports.transpose(1,2,0)
-					self.imageBottomPlate = self.imageBottomPlate.reshape(1, height, width)
-					self.imageBottomPlate = self.imageBottomPlate.transpose(1,2,0)
-					# Remove 3rd dimension.
-					self.imageModel = numpy.squeeze(self.imageModel)
-					self.imageSupports = numpy.squeeze(self.imageSupports)
-					self.imageBottomPlate = numpy.squeeze(self.imageBottomPlate)
-					# Cast to uint8.
-					self.imageModel = numpy.uint8(self.imageModel)
-					self.imageSupports = numpy.uint8(self.imageSupports)
-					self.imageBottomPlate = numpy.uint8(self.imageBottomPlate)
-
-					# Create fill pattern. #####################################
-					# Get pixel values from 10 slices above and below.
-					# We need to analyse these to be able to generate closed bottom and top surfaces.
-					# Only use model slice data. Supports and bottom plate have no internal pattern anyway.
-					# Check if we are in the first or last mm of the model, then there should not be a pattern anyways, so we set everything black.
-					# Only do this whole thing if fillFlag is set and fill is shown or print is going.
-					if self.settings['Print hollow'].value == True:# and (self.programSettings['Show fill'].value == True or self.printFlag == True):
-						# Start time measurement.
-						if self.programSettings['Debug'].value:
-							interval = time.time()	
-											
-						# Get wall thickness from settings.
-						wallThickness = self.settings['Shell wall thickness'].value	# [mm]
-						wallThicknessPx = wallThickness * self.programSettings['pxPerMm'].value
-					
-						# Get top and bottom masks for wall thickness.
-						# Only if we one wall thickness below top or above bottom.
-						if bounds[5] > layerHeight*sliceNumber+wallThickness and bounds[4] < layerHeight*sliceNumber-wallThickness:	
-						
-							# Set cutting plane + wall thickness for top mask.
-							self.cuttingPlane.SetOrigin(0,0,layerHeight*sliceNumber+wallThickness)
-							self.extruderModel.SetVector(0,0,-sliceNumber+wallThickness*layerHeight-1)
-							self.stencilModel.Update()
-				
-							# Get mask image data as numpy array.
-							self.imageTopMask = numpy_support.vtk_to_numpy(self.stencilModel.GetOutput().GetPointData().GetScalars())
-				
-							# Set cutting plate - wall thickness for bottom mask.
-							self.cuttingPlane.SetOrigin(0,0,layerHeight*sliceNumber-wallThickness)
-							self.extruderModel.SetVector(0,0,-sliceNumber+wallThickness*layerHeight-1)
-							self.stencilModel.Update()
-				
-							# Get mask image data as numpy array.
-							self.imageBottomMask = numpy_support.vtk_to_numpy(self.stencilModel.GetOutput().GetPointData().GetScalars())
-						
-							# Now we have the pixel values in a long list. Transform them into a 2d array.
-							self.imageTopMask = self.imageTopMask.reshape(1, height, width)
-							self.imageTopMask = self.imageTopMask.transpose(1,2,0)
-							self.imageBottomMask = self.imageBottomMask.reshape(1, height, width)
-							self.imageBottomMask = self.imageBottomMask.transpose(1,2,0)
-						
-							# Cast to uint8.
-							self.imageTopMask = numpy.uint8(self.imageTopMask)
-							self.imageBottomMask = numpy.uint8(self.imageBottomMask)
-					
-						# If cutting plane is inside top or bottom wall...
-						else:
-							# ... set masks black.
-							self.imageTopMask = self.imageBlack
-							self.imageBottomMask = self.imageBlack
-	
-
-						# Erode model image to create wall thickness.
-						self.imageEroded = cv2.erode(self.imageModel, numpy.ones((wallThicknessPx,wallThicknessPx), numpy.uint8), iterations=1)
-						
-						# Multiply mask images with eroded image to prevent wall where mask images are black.
-						self.imageEroded = cv2.multiply(self.imageEroded, self.imageTopMask)
-						self.imageEroded = cv2.multiply(self.imageEroded, self.imageBottomMask)
-		
-						# Add internal pattern to wall. Write result to original slice image.
-						if self.settings['Fill'].value == True:
-					
-							# Shift internal pattern 1 pixel to prevent burning in the pdms coating.
-							patternShift = 1	# TODO: implement setting for pattern shift.
-							self.imageFill = numpy.roll(self.imageFill, patternShift, axis=0)
-							self.imageFill = numpy.roll(self.imageFill, patternShift, axis=1)
-			
-							# Mask internal pattern using the eroded image.
-							self.imageEroded = cv2.multiply(self.imageEroded, self.imageFill)
-
-						# Subtract cavity with our without fill pattern from model.
-						self.imageModel = cv2.subtract(self.imageModel, self.imageEroded)
-						
-						# End time measurement.
-						if self.programSettings['Debug'].value:
-							interval = time.time() - interval
-							print "Slice: " + str(sliceNumber) + ". Erode time: " + str(interval) + "."
-						
-					# Combine model, supports and bottom plate images.
-					self.imageModel = cv2.add(self.imageModel, self.imageSupports)
-					self.imageModel = cv2.add(self.imageModel, self.imageBottomPlate)
-					
-					# Save image.
-			#		im = Image.fromarray(self.imageModel)
-			#		fileString = "sliceprint%03d.jpeg" % (sliceNumber,)
-			#		im.save(fileString)
-					
-					# Write slice image to slice stack.
-					self.sliceStack.append(self.imageModel)
-				else:
-					# If new stack is in queue, break. //return the current stack.
-					if self.console:
-						self.console.addLine("Restarting slicer.")
-					break
-					#return self.sliceStack
-			return self.sliceStack
-		
-		
-		
-	def createFillPattern(self, width, height):
-		if not self.stopThread.isSet():
-			# Create an opencv image with rectangular pattern for filling large model areas.
-			imageFill = numpy.ones((height, width), numpy.uint8) * 255
-	
-			# Set every Nth vertical line (and it's  neighbour or so) white.
-			spacing = self.settings['Fill spacing'].value * self.programSettings['pxPerMm'].value
-			wallThickness = self.settings['Fill wall thickness'].value * self.programSettings['pxPerMm'].value
-			for pixelX in range(width):
-				if (pixelX / spacing - math.floor(pixelX / spacing)) * spacing < wallThickness:
-					imageFill[:,pixelX-1] = 0
-			for pixelY in range(height):
-				if (pixelY / spacing - math.floor(pixelY / spacing)) * spacing < wallThickness:
-					imageFill[pixelY-1,:] = 0		
-			return imageFill
-			
+	# Each finished layer is written to the output queue right away.
+	def updateSlices(self, inputModel, cancelJob):
+		# Set inputs and calc slice stack parameters.
+		self.pipeline.setInput(inputModel)
+		print "Model bounds: " + str(self.pipeline.bounds) + "."
+		print "Width and height: " + str((self.pipeline.width, self.pipeline.height)) + "."
+		
+		# Get layer fingerprints and find the layers that have changed.
+		fingerprints = self.pipeline.getLayerFingerprints()
+		changedSlices = [sliceNumber for sliceNumber in range(len(fingerprints)) if fingerprints[sliceNumber] not in self.sliceCache]
+		if self.console:
+			self.console.addLine("Slicing " + str(len(changedSlices)) + " of " + str(len(fingerprints)) + " layers.")
+		
+		# Create the memory mapped file for the slices if requested.
+		self.stackFile = createSliceStackFile(self.programSettings, len(fingerprints), (self.pipeline.height, self.pipeline.width))
+		self.volumeModelSlices = {}
+		
+		# Take unchanged slices from the last run.
+		sliceStack = [None for i in range(len(fingerprints))]
+		sliceCache = {}
+		for sliceNumber in range(len(fingerprints)):
+			if fingerprints[sliceNumber] in self.sliceCache:
+				self.setSlice(sliceStack, sliceCache, fingerprints, sliceNumber, self.sliceCache[fingerprints[sliceNumber]], cancelJob)
+		
+		# Use the parallel slicer if more than one process is requested.
+		if self.programSettings['Slicer processes'].value > 1 and len(changedSlices) > 1:
+			sliceStack = self.updateSlicesParallel(inputModel, fingerprints, changedSlices, sliceStack, sliceCache, cancelJob)
+		else:
+			sliceStack = self.updateSlicesSerial(fingerprints, changedSlices, sliceStack, sliceCache, cancelJob)
+		
+		# Hollow the new layers in 3D once they are all sliced.
+		if self.pipeline.volumeHollowing and not self.isCancelled(cancelJob):
+			sliceStack = self.hollowSlices(fingerprints, changedSlices, sliceStack, self.sliceCache, cancelJob)
+		self.volumeModelSlices = {}
+		return sliceStack
+	
+	
+	# Slice the changed layers in this thread.
+	def updateSlicesSerial(self, fingerprints, changedSlices, sliceStack, sliceCache, cancelJob):
+		# Slice the changed layers by priority, last one in the list first.
+		focus = self.focus
+		order = self.getSliceOrder(changedSlices, focus)[::-1]
+		while len(order):
+			# Make breakable by new input or termination request.
+			if self.isCancelled(cancelJob):
+				# Keep the old slices as well, the new input may need them.
+				self.sliceCache.update(sliceCache)
+				return sliceStack
+			# Reorder if the user has moved to another layer.
+			if self.focus != focus:
+				focus = self.focus
+				order = self.getSliceOrder(order, focus)[::-1]
+			sliceNumber = order.pop()
+			self.setSlice(sliceStack, sliceCache, fingerprints, sliceNumber, self.pipeline.sliceLayer(sliceNumber), cancelJob, not self.pipeline.volumeHollowing)
+			self.setVolumeModelSlice(sliceNumber, self.pipeline.popVolumeModelSlice(sliceNumber))
+		self.sliceCache = sliceCache
+		return sliceStack
+	
+	
+	# Write a slice to the stack and the output queue.
+	# Slices are converted to the storage type from the settings
+	# and written to the memory mapped file if there is one.
+	# Slices that are not final yet, e.g. before 3D hollowing,
+	# are not written to the layer cache.
+	def setSlice(self, sliceStack, sliceCache, fingerprints, sliceNumber, image, cancelJob, final=True):
+		image = imageHandling.encodeImage(image, self.programSettings['Slice storage'].value)
+		if self.stackFile != None:
+			image = self.stackFile.write(sliceNumber, image)
+		sliceStack[sliceNumber] = image
+		if final:
+			sliceCache[fingerprints[sliceNumber]] = image
+		self.queueSlicerOut.put(['slice', cancelJob, sliceNumber, image, final])
+	
+	# Keep a model slice for 3D hollowing in the slice storage format.
+	def setVolumeModelSlice(self, sliceNumber, image):
+		if image is not None:
+			self.volumeModelSlices[sliceNumber] = imageHandling.encodeImage(image, self.programSettings['Slice storage'].value)
+	
+	
+	# Hollow the given layers in 3D.
+	# The model slices kept while slicing are stacked into a volume chunk
+	# by chunk to keep memory bounded. Only layers that have not been
+	# sliced, e.g. unchanged neighbours, are cut again. Chunks overlap by one wall thickness so the distance
+	# transform sees all surfaces close enough to matter. Everything that
+	# is further away from the surface than the wall thickness is removed
+	# from the slice images.
+	def hollowSlices(self, fingerprints, sliceNumbers, sliceStack, sliceCache, cancelJob):
+		pipeline = self.pipeline
+		numberOfSlices = len(sliceStack)
+		wallThickness = self.settings['Shell wall thickness'].value
+		overlap = int(math.ceil(wallThickness / pipeline.layerHeight)) + 1
+		# Limit chunks to about 16 million voxels.
+		chunkSize = max(2 * overlap, (1 << 24) / (pipeline.width * pipeline.height))
+		spacing = (pipeline.layerHeight, 1. / self.programSettings['pxPerMm'].value, 1. / self.programSettings['pxPerMm'].value)
+		sliceNumbers = sorted(sliceNumbers)
+		while len(sliceNumbers):
+			# Make breakable by new input or termination request.
+			if self.isCancelled(cancelJob):
+				return sliceStack
+			# Next chunk starts at the lowest layer that is not hollowed yet.
+			start = sliceNumbers[0]
+			stop = min(start + chunkSize, numberOfSlices)
+			chunk = [sliceNumber for sliceNumber in sliceNumbers if sliceNumber < stop]
+			sliceNumbers = sliceNumbers[len(chunk):]
+			# Stack the model slices of the chunk and its overlap.
+			# Layers outside the slice stack are empty.
+			volume = numpy.zeros((stop - start + 2 * overlap, pipeline.height, pipeline.width), numpy.uint8)
+			for sliceNumber in range(max(0, start - overlap), min(numberOfSlices, stop + overlap)):
+				if sliceNumber not in self.volumeModelSlices:
+					pipeline.timer.setLayer(sliceNumber)
+					self.volumeModelSlices[sliceNumber] = pipeline.engine.sliceModel(pipeline.getSlicePosition(sliceNumber))
+				volume[sliceNumber - start + overlap] = imageHandling.unpackImage(self.volumeModelSlices[sliceNumber])
+			# Drop the model slices that later chunks don't overlap.
+			for sliceNumber in range(max(0, start - overlap), stop - overlap):
+				self.volumeModelSlices.pop(sliceNumber, None)
+			# Get the cavity and subtract it from the slices.
+			# The time of the distance transform is split over the layers of the chunk.
+			interval = time.time()
+			cavity = imageHandling.shellCavity(volume, wallThickness, spacing)
+			interval = time.time() - interval
+			for sliceNumber in chunk:
+				pipeline.timer.add('distance', interval / len(chunk), sliceNumber)
+				imageCavity = numpy.uint8(cavity[sliceNumber - start + overlap]) * numpy.uint8(255)
+				if self.settings['Fill'].value == True:
+					imageCavity = cv2.multiply(imageCavity, pipeline.getFillPattern(sliceNumber))
+				image = cv2.subtract(imageHandling.unpackImage(sliceStack[sliceNumber]), imageCavity)
+				self.setSlice(sliceStack, sliceCache, fingerprints, sliceNumber, image, cancelJob)
+		return sliceStack
+	
+	
+	# Update slice stack using a pool of worker processes.
+	# The changed layers are split into chunks by priority that are
+	# sliced by the workers and collected as they come in.
+	def updateSlicesParallel(self, inputModel, fingerprints, changedSlices, sliceStack, sliceCache, cancelJob):
+		numberOfProcesses = int(self.programSettings['Slicer processes'].value)
+		# Split large images into tiles that are sliced by different workers.
+		tiles = self.pipeline.getTiles()
+		# Use a few chunks per process to balance the load
+		# as layers with hollowing or many supports take longer.
+		# With tiles, each chunk is sliced once per tile, so use smaller chunks.
+		chunkSize = max(1, int(math.ceil(len(changedSlices) / (numberOfProcesses * 4. * len(tiles)))))
+		order = self.getSliceOrder(changedSlices, self.focus)
+		layerChunks = [order[start:start+chunkSize] for start in range(0, len(order), chunkSize)]
+		if self.console:
+			self.console.addLine("Slicing " + str(len(changedSlices)) + " layers with " + str(numberOfProcesses) + " processes.")
+			if len(tiles) > 1:
+				self.console.addLine("Using " + str(len(tiles)) + " tiles per layer.")
+		# Drop wake up calls of earlier jobs.
+		while True:
+			try:
+				self.queueResults.get_nowait()
+			except Queue.Empty:
+				break
+		# Start the pool. Each worker builds its pipeline from the job data.
+		pool = multiprocessing.Pool(	processes=numberOfProcesses,
+									initializer=initSlicerWorker,
+									initargs=(	getSettingsValues(self.settings),
+												getSettingsValues(self.programSettings),
+												getInputMeshes(inputModel),
+												inputModel[3],
+												inputModel[4] if len(inputModel) > 4 else None	)	)
+		# Chunks are started in order, all tiles of a chunk one after another.
+		# Results are written to the results queue.
+		for layerChunk in layerChunks:
+			for tile in tiles:
+				pool.apply_async(sliceLayers, (layerChunk, tile), callback=self.queueResults.put)
+		# Layers that are waiting for tiles and the number of tiles they got.
+		tiledImages = {}
+		tiledModelImages = {}
+		tileCounts = {}
+		# Collect the chunks as they come in.
+		numberOfChunks = 0
+		while numberOfChunks < len(layerChunks) * len(tiles):
+			# Wait for the next chunk or a wake up call.
+			result = self.queueResults.get()
+			# Make breakable by new input or termination request.
+			if self.isCancelled(cancelJob):
+				pool.terminate()
+				pool.join()
+				# Keep the old slices as well, the new input may need them.
+				self.sliceCache.update(sliceCache)
+				return sliceStack
+			if result == None:
+				continue
+			layerChunk, chunk, timings, tile, modelChunk = result
+			self.pipeline.timer.merge(timings)
+			# Continue in this thread on errors in the worker.
+			if isinstance(chunk, Exception):
+				if self.console:
+					self.console.addLine("Slicer process failed: " + str(chunk) + ". Continuing without processes.")
+				pool.terminate()
+				pool.join()
+				missingSlices = [sliceNumber for sliceNumber in changedSlices if sliceStack[sliceNumber] is None]
+				return self.updateSlicesSerial(fingerprints, missingSlices, sliceStack, sliceCache, cancelJob)
+			for i in range(len(layerChunk)):
+				sliceNumber = layerChunk[i]
+				image = chunk[i]
+				modelImage = modelChunk[i]
+				# Stitch tiles into the layer image until all are there.
+				if tile != None:
+					if sliceNumber not in tiledImages:
+						tiledImages[sliceNumber] = numpy.zeros((self.pipeline.height, self.pipeline.width), numpy.uint8)
+						tileCounts[sliceNumber] = 0
+					tiledImages[sliceNumber][tile[1]:tile[3], tile[0]:tile[2]] = image
+					if modelImage is not None:
+						if sliceNumber not in tiledModelImages:
+							tiledModelImages[sliceNumber] = numpy.zeros((self.pipeline.height, self.pipeline.width), numpy.uint8)
+						tiledModelImages[sliceNumber][tile[1]:tile[3], tile[0]:tile[2]] = modelImage
+					tileCounts[sliceNumber] += 1
+					if tileCounts[sliceNumber] < len(tiles):
+						continue
+					image = tiledImages.pop(sliceNumber)
+					modelImage = tiledModelImages.pop(sliceNumber, None)
+					del tileCounts[sliceNumber]
+				self.setSlice(sliceStack, sliceCache, fingerprints, sliceNumber, image, cancelJob, not self.pipeline.volumeHollowing)
+				self.setVolumeModelSlice(sliceNumber, modelImage)
+			numberOfChunks += 1
+		pool.close()
+		pool.join()
+		self.sliceCache = sliceCache
+		return sliceStack
 
 
 
@@ -120,6 +120,9 @@ class monkeyprintPiServer:
 		# This object contains model data and settings data for each model.
 		# Pass program settings.
 		self.modelCollection = monkeyprintModelHandling.modelCollection(self.programSettings)
+		
+		# Check the slicer threads. Printing starts before slicing is done.
+		slicerListenerId = gobject.timeout_add(100, self.modelCollection.checkSlicerThreads)
 	
 	
 		#TODO disable this...
@@ -212,15 +215,16 @@ class monkeyprintPiServer:
 					# TODO: get current slice number to show on progress bar.
 		print ("Starting slicer.")
 
-		# Wait for all slicer threads to finish.
-		while(self.modelCollection.slicerRunning()):
+		# Wait for the first layers to be sliced. The print process
+		# waits for the remaining layers if it catches up with the slicer.
+		while(not self.modelCollection.slicesReady(1, int(self.programSettings['Print start layers'].value)+1)):
 			self.modelCollection.checkSlicerThreads()
 			time.sleep(.5)
 			sys.stdout.write('.')
 			sys.stdout.flush()
 	
-		# Start print process when slicers are done.
-		print "\nSlicer done. Starting print process."
+		# Start print process when the first layers are done.
+		print "\nFirst layers sliced. Starting print process."
 		
 		
 		# Make sure status messages get sent.
@@ -33,6 +33,7 @@ class printProcess(threading.Thread):
 	# TODO: merge all queues into one, send tuple with [infoType, info]
 		# Internalise settings.
 		self.settings = settings
+		self.modelCollection = modelCollection
 		self.queueSliceOut = queueSliceOut
 		self.queueSliceIn = queueSliceIn
 		self.queueStatus = queueStatus
@@ -133,6 +134,20 @@ class printProcess(threading.Thread):
 			index += 1
 	
 	
+	# Wait until the given slices have been created by the slicer.
+	# Returns False if the print has been stopped in the meantime.
+	def waitForSlices(self, start, stop):
+		if self.modelCollection.slicesReady(start, stop):
+			return True
+		self.queueConsole.put("   Waiting for slicer.")
+		print "Waiting for slicer."
+		while not self.stopThread.isSet():
+			if self.modelCollection.slicesReady(start, stop):
+				return True
+			time.sleep(0.1)
+		return False
+	
+	
 	# Listen to the carry on command queue until the carry on command is issued.
 	def holdUntilConfirm(self):
 		pass
@@ -311,8 +326,14 @@ class printProcess(threading.Thread):
 			if not self.runGCode:
 				self.serialPrinter.send(['printingFlag', 1, True, None])
 		
+		# Wait for the first layers in case slicing is still running.
+		self.waitForSlices(1, min(self.numberOfSlices, int(self.settings['Print start layers'].value))+1)
+		
 		# Start the print loop.
 		while not self.stopThread.isSet() and self.slice < self.numberOfSlices+1:
+			# Wait if we have caught up with the slicer.
+			if not self.waitForSlices(self.slice, self.slice+1):
+				break
 			self.queueConsole.put("Printing slice " + str(self.slice) + ".")
 			#self.queueStatus.put("Printing slice " + str(self.slice) + " of " + str(self.numberOfSlices) + ".")
 			self.queueStatus.put("printing:nSlices:" + str(self.numberOfSlices))
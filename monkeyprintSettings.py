@@ -18,6 +18,12 @@
 #	You have received a copy of the GNU General Public License
 #    along with monkeyprint.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
+
+# Per user directory for the slice cache.
+sliceCachePath = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'monkeyprint', 'slicecache')
+
 
 class setting:
 	def __init__(self, value, lower=None, upper=None, unit='', default=None, valType=None):
@@ -85,6 +91,7 @@ class modelSettings(dict):
 		self['Spacing X'] = setting(value=5,	lower=0,	upper=10,	unit='mm')
 		self['Spacing Y'] = setting(value=5,	lower=0,	upper=10,	unit='mm')
 		self['Maximum height'] = setting(value=20,	lower=1,	upper=1000,	unit='mm')
+		self['Support regions'] = setting(value=False)
 		self['Base diameter'] = setting(value=1.5,	lower=0.3,	upper=5.0,	unit='mm')
 		self['Tip diameter'] = setting(value=0.5,	lower=0.1,	upper=0.5,	unit='mm')
 		self['Cone height'] = setting(value=2.5,	lower=1.0,	upper=10.0,	unit='mm')
@@ -173,6 +180,22 @@ class programSettings(dict):
 		self['Layer height'] = setting(value=0.1, lower=.05, upper=0.3, unit='mm')
 		self['Model safety distance'] = setting(value=1.0, unit='mm')
 		self['Debug'] = setting(value=False)
+		self['Slicer processes'] = setting(value=1, default=1, lower=1, upper=64)
+		self['Slicing engine'] = setting(value='vtk', default='vtk')
+		self['Lazy slicing'] = setting(value=False, default=False)
+		self['Prefetch layers'] = setting(value=10, default=10, lower=0, upper=1000)
+		self['Priority layers'] = setting(value=10, default=10, lower=0, upper=1000)
+		self['Slice cache path'] = setting(value=sliceCachePath, default=sliceCachePath)
+		self['Slice cache size'] = setting(value=1000, default=1000, lower=0, upper=100000, unit='MB')
+		self['Slice storage'] = setting(value='full', default='full')
+		self['Memory mapped slices'] = setting(value=False, default=False)
+		self['Slice scratch path'] = setting(value='./scratch', default='./scratch')
+		self['Combined stencil'] = setting(value=False, default=False)
+		self['Analytic supports'] = setting(value=False, default=False)
+		self['Slice tile size'] = setting(value=0, default=0, lower=0, upper=10000, unit='px')
+		self['Hollowing method'] = setting(value='erode', default='erode')
+		self['Print start layers'] = setting(value=10, lower=1, upper=1000, default=10)
+		self['Slice timing file'] = setting(value='', default='')
 		self['Exposure time base'] = setting(value=14.0, lower=1.0, upper=15.0)
 		self['Exposure time'] = setting(value=9.0, lower=1.0, upper=15.0)
 		self['Resin settle time'] = setting(value=1.0, lower=0.0, upper=5.0)
@@ -0,0 +1,158 @@
+# -*- coding: latin-1 -*-
+
+#	Copyright (c) 2015 Paul Bomke
+#	Distributed under the GNU GPL v2.
+#
+#	This file is part of monkeyprint.
+#
+#	monkeyprint is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	monkeyprint is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You have received a copy of the GNU General Public License
+#    along with monkeyprint.  If not, see <http://www.gnu.org/licenses/>.
+
+# Disk cache for slice stacks.
+# Slice stacks are packed to one bit per pixel and
+# saved as compressed numpy files named after a hash of
+# everything that goes into slicing: the stl file, the model settings and
+# the program settings that affect the slice images.
+
+import os
+import hashlib
+import numpy
+import monkeyprintImageHandling as imageHandling
+
+
+# Program settings that change the slice images. Build and projector
+# size set the model position and with it the pixel grid.
+programSettingsKeys = ['pxPerMm', 'Layer height', 'Model safety distance', 'Slicing engine', 'Hollowing method', 'Combined stencil', 'Analytic supports', 'Build size X', 'Build size Y', 'Build size Z', 'Projector size X', 'Projector size Y']
+
+# Model settings that don't change the slice images.
+modelSettingsIgnore = ['filename', 'Active']
+
+
+# Get the hash of a file's content. Returns None if the file can't be read.
+def hashFile(filename):
+	fileHash = hashlib.sha1()
+	try:
+		with open(filename, 'rb') as f:
+			while True:
+				data = f.read(1 << 20)
+				if not data:
+					break
+				fileHash.update(data)
+	except (IOError, OSError):
+		return None
+	return fileHash.hexdigest()
+
+
+# Get the cache key for a model. Returns None if there is no stl hash.
+def getCacheKey(stlHash, modelSettings, programSettings):
+	if stlHash == None:
+		return None
+	key = hashlib.sha1(stlHash)
+	for setting in sorted(modelSettings):
+		if setting not in modelSettingsIgnore:
+			key.update(repr((setting, modelSettings[setting].value)))
+	for setting in programSettingsKeys:
+		key.update(repr((setting, programSettings[setting].value)))
+	return key.hexdigest()
+
+
+
+
+################################################################################
+# Slice stack disk cache. ######################################################
+################################################################################
+# Cache directory and size budget are taken from the program settings.
+# If the cache grows beyond the budget, the least recently used
+# stacks are removed.
+class diskSliceCache:
+	def __init__(self, programSettings, console=None):
+		# Internalise inputs.
+		self.programSettings = programSettings
+		self.console = console
+
+
+	def getPath(self):
+		return self.programSettings['Slice cache path'].value
+
+	# Cache size budget in bytes. Zero disables the cache.
+	def getBudget(self):
+		return self.programSettings['Slice cache size'].value * 1024 * 1024
+
+	def getFilename(self, key):
+		return os.path.join(self.getPath(), key + '.npz')
+
+
+	# Load a slice stack of packed images.
+	# Returns None if it's not in the cache.
+	def load(self, key):
+		if key == None or self.getBudget() <= 0:
+			return None
+		filename = self.getFilename(key)
+		if not os.path.isfile(filename):
+			return None
+		try:
+			data = numpy.load(filename)
+			shapes = data['shapes']
+			sliceStack = [imageHandling.packedImage(data['arr_%d' % i], shapes[i]) for i in range(len(shapes))]
+			data.close()
+			# Mark as recently used.
+			os.utime(filename, None)
+		except Exception, error:
+			print "Could not load slices from cache: " + str(error) + "."
+			return None
+		return sliceStack
+
+
+	# Save a slice stack and remove old stacks if the cache is too big.
+	def save(self, key, sliceStack):
+		if key == None or self.getBudget() <= 0:
+			return
+		try:
+			if not os.path.isdir(self.getPath()):
+				os.makedirs(self.getPath())
+			# Write to a temporary file first so that no
+			# half written stacks end up in the cache.
+			filename = self.getFilename(key)
+			sliceStack = [self.pack(image) for image in sliceStack]
+			with open(filename + '.tmp', 'wb') as f:
+				numpy.savez_compressed(f, *[image.data for image in sliceStack], shapes=numpy.array([image.shape for image in sliceStack]))
+			os.rename(filename + '.tmp', filename)
+		except (IOError, OSError), error:
+			print "Could not save slices to cache: " + str(error) + "."
+			return
+		self.evict()
+
+
+	# Pack an image if it's not packed yet.
+	def pack(self, image):
+		return imageHandling.encodeImage(image, 'packed')
+
+
+	# Remove least recently used stacks until the cache fits the budget.
+	def evict(self):
+		files = []
+		for filename in os.listdir(self.getPath()):
+			if filename.endswith('.npz'):
+				path = os.path.join(self.getPath(), filename)
+				files.append((os.path.getmtime(path), os.path.getsize(path), path))
+		# Oldest first.
+		files.sort()
+		size = sum([f[1] for f in files])
+		for mtime, fileSize, path in files:
+			if size <= self.getBudget():
+				break
+			try:
+				os.remove(path)
+				size -= fileSize
+			except OSError:
+				pass